@@ -1,7 +1,7 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+import numpy as np
 import time
 import datetime
 
@@ -179,6 +179,10 @@ st.sidebar.info("💡 数据来源: AkShare / 公开网络\n🔒 数据存储: 
 # --- Page: Dashboard ---
 @st.fragment
 def show_dashboard_metrics():
+    # Plotly is imported lazily so pages without charts don't pay for it at startup
+    import plotly.graph_objects as go
+    import plotly.express as px
+
     # 1. Top Metrics (Holdings Summary)
     holdings = database.get_holdings()
     
@@ -255,22 +259,23 @@ def show_dashboard_metrics():
     
     # Save daily asset snapshot for history chart
     if total_market_value > 0:
-        today_str = datetime.date.today().strftime('%Y-%m-%d')
+        today_str = datetime.date.today().isoformat()
         database.save_asset_snapshot(today_str, total_market_value, total_cost, day_profit)
     
     st.divider()
     
+    # HS300, US indices and the pinned watchlist are independent requests: fetch them concurrently
+    user_indices = database.get_user_indices()
+    index_data, global_indices, u_details = data_api.get_dashboard_quotes([row['symbol'] for row in user_indices])
+    
     # Market Indices
     st.caption("🌍 全球市场指数")
     m1, m2, m3, m4 = st.columns(4)
     
     # 1. HS300 (China)
-    index_data = data_api.get_market_index()
     m1.metric(index_data.get('名称', '沪深300'), f"{index_data.get('最新价', 0)}", f"{index_data.get('涨跌幅', 0)}%", delta_color="inverse")
     
     # 2. Global Indices (US)
-    global_indices = data_api.get_global_indices()
-    
     # Helper to find index by name part
     def get_idx(name_part):
         return next((x for x in global_indices if name_part in x['name']), None)
@@ -295,21 +300,19 @@ def show_dashboard_metrics():
         m4.metric("纳斯达克", "加载中...", "--")
 
     # --- User Selected Indices/Stocks ---
-    user_indices = database.get_user_indices()
-    if not user_indices.empty:
+    if user_indices:
         st.caption("📌 自选行情")
         
         # Grid layout for user indices
         # We process them in chunks of 4 to keep the layout clean
-        u_rows = [user_indices.iloc[i:i+4] for i in range(0, len(user_indices), 4)]
+        u_rows = [user_indices[i:i+4] for i in range(0, len(user_indices), 4)]
         
         for chunk in u_rows:
             u_cols = st.columns(4)
-            for idx, (_, row) in enumerate(chunk.iterrows()):
+            for idx, row in enumerate(chunk):
                 with u_cols[idx]:
-                    # Fetch real-time data
                     full_code = row['symbol']
-                    detail = data_api.get_stock_realtime_detail(full_code)
+                    detail = u_details.get(full_code)
                     
                     # Prepare stock info for navigation
                     stock_info = {
@@ -348,8 +351,6 @@ def show_dashboard_metrics():
             history_df = database.get_asset_history()
             
             if not history_df.empty:
-                history_df['date'] = pd.to_datetime(history_df['date'])
-                history_df = history_df.set_index('date')
                 history_series = history_df['total_market_value']
                 
                 # Determine Color based on Day Profit
@@ -441,16 +442,33 @@ def show_dashboard_metrics():
                     if not st.session_state.get('ai_api_key'):
                         st.error("请先在左侧配置 DeepSeek API Key")
                     else:
-                        with st.spinner("DeepSeek AI 正在深度扫描您的持仓组合..."):
-                            holdings_list = holdings[['fund_code', 'fund_name', 'share', 'cost_price']].to_dict('records')
-                            report = logic.analyze_portfolio_with_ai(
+                        holdings_list = holdings[['fund_code', 'fund_name', 'share', 'cost_price']].to_dict('records')
+                        st.markdown("### 📋 AI 深度诊断报告")
+                        with st.container(height=400):
+                            # Streamed: the report renders token by token as DeepSeek generates it
+                            st.write_stream(logic.analyze_portfolio_with_ai(
                                 holdings_list,
                                 st.session_state['ai_api_key'], 
                                 st.session_state.get('ai_endpoint_id', 'deepseek-chat')
+                            ))
+                
+                if st.button("🧾 逐只基金 AI 点评 (DeepSeek)", use_container_width=True):
+                    if not st.session_state.get('ai_api_key'):
+                        st.error("请先在左侧配置 DeepSeek API Key")
+                    else:
+                        funds_list = holdings[['fund_code', 'fund_name']].drop_duplicates('fund_code').to_dict('records')
+                        with st.spinner("AI 正在逐只分析持仓基金..."):
+                            # One request for all holdings instead of one per fund
+                            analyses = logic.analyze_funds_batch_with_ai(
+                                funds_list,
+                                st.session_state['ai_api_key'],
+                                st.session_state.get('ai_endpoint_id', 'deepseek-chat')
                             )
-                            st.markdown("### 📋 AI 深度诊断报告")
-                            with st.container(height=400):
-                                st.markdown(report)
+                        st.markdown("### 🧾 逐只基金点评")
+                        with st.container(height=400):
+                            for fund in funds_list:
+                                with st.expander(f"{fund['fund_name']} ({fund['fund_code']})", expanded=True):
+                                    st.markdown(analyses[fund['fund_code']])
                 
                 if st.button("📊 本地量化诊断 (免费)", use_container_width=True):
                     with st.spinner("正在进行本地量化分析..."):
@@ -490,6 +508,8 @@ def render_dashboard():
 
 # --- Page: Search & Diagnose ---
 def render_search():
+    import plotly.graph_objects as go
+
     st.title("🔍 基金查询与诊断")
     
     # Show success message if exists in session state
@@ -663,21 +683,21 @@ def render_search():
                     if diag_mode == "本地专家诊断 (免费)":
                         if st.button("🚀 生成本地深度分析", use_container_width=True):
                             with st.spinner("专家引擎正在分析中..."):
-                                local_report = logic.analyze_fund_locally(fund_code, fund_name=info['name'])
+                                local_report = logic.analyze_fund_locally(fund_code, fund_name=info['name'], diagnosis=diag)
                                 st.markdown(local_report)
                     else:
                         if st.button("🚀 开始 AI 深度分析", use_container_width=True):
                             if not st.session_state.get('ai_api_key'):
                                 st.error("请先在左侧边栏配置 DeepSeek API Key")
                             else:
-                                with st.spinner("DeepSeek 正在分析中，请稍候..."):
-                                    ai_analysis = logic.analyze_fund_with_ai(
-                                        fund_code, 
-                                        st.session_state['ai_api_key'], 
-                                        st.session_state.get('ai_endpoint_id', 'deepseek-chat'),
-                                        fund_name=info['name']
-                                    )
-                                    st.markdown(ai_analysis)
+                                # Streamed: the report renders token by token as DeepSeek generates it
+                                st.write_stream(logic.analyze_fund_with_ai(
+                                    fund_code, 
+                                    st.session_state['ai_api_key'], 
+                                    st.session_state.get('ai_endpoint_id', 'deepseek-chat'),
+                                    fund_name=info['name'],
+                                    diagnosis=diag
+                                ))
                     
                     # Charts Section
                     chart_tabs = st.tabs(["当日分时估值", "历史净值走势"])
@@ -729,7 +749,8 @@ def render_search():
                             try:
                                 est_date_str = est.get('data_date') if est else None
                                 if est_date_str and est and est.get('gz'):
-                                    est_date = pd.to_datetime(est_date_str)
+                                    # data_date is always ISO (YYYY-MM-DD); placeholders raise and are skipped
+                                    est_date = pd.to_datetime(est_date_str, format='%Y-%m-%d')
                                     if hist_df['净值日期'].max() < est_date:
                                         new_row = pd.DataFrame({'净值日期': [est_date], '单位净值': [float(est['gz'])]})
                                         hist_df = pd.concat([hist_df, new_row], ignore_index=True)
@@ -764,6 +785,8 @@ def render_search():
 
 # --- Page: Stock Analysis ---
 def render_stock_analysis():
+    import plotly.graph_objects as go
+
     st.title("📈 股票行情分析")
     
     # Get selected stock from session state
@@ -806,7 +829,7 @@ def render_stock_analysis():
 
     # --- Dashboard Toggle Button ---
     user_indices = database.get_user_indices()
-    is_in_dashboard = full_code in user_indices['symbol'].values if not user_indices.empty else False
+    is_in_dashboard = any(item['symbol'] == full_code for item in user_indices)
     
     col_dash_btn, col_rest = st.columns([1, 5])
     with col_dash_btn:
@@ -828,7 +851,7 @@ def render_stock_analysis():
     @st.fragment(run_every=run_interval)
     def _stock_fragment():
         with st.spinner(f"正在获取 {name} 实时行情..."):
-            detail = data_api.get_stock_realtime_detail(full_code)
+            detail = data_api.get_stock_realtime_detail(full_code, include_bid_ask=True)
             
         if not detail:
             st.error("获取实时行情失败，请稍后重试。")
@@ -882,8 +905,8 @@ def render_stock_analysis():
             
             with tab_intra:
                 trends_data = data_api.get_stock_trends(symbol, market)
-                if trends_data and trends_data['trends']:
-                    df_trends = pd.DataFrame(trends_data['trends'])
+                if trends_data and not trends_data['trends'].empty:
+                    df_trends = trends_data['trends']
                     # Pre-close line
                     pre_close = trends_data['pre_close']
                     
@@ -931,9 +954,8 @@ def render_stock_analysis():
                     st.info("暂无分时数据")
 
             def plot_kline(period_code):
-                k_data = data_api.get_stock_kline(symbol, market, period_code)
-                if k_data:
-                    df_k = pd.DataFrame(k_data)
+                df_k = data_api.get_stock_kline(symbol, market, period_code)
+                if df_k is not None and not df_k.empty:
                     
                     fig = go.Figure(data=[go.Candlestick(
                         x=df_k['date'],
@@ -1019,6 +1041,8 @@ def render_stock_analysis():
 
 # --- Page: Holdings ---
 def render_holdings():
+    import plotly.graph_objects as go
+
     st.title("💼 持仓管理")
     
     run_interval = 1 if auto_refresh else None
@@ -1027,6 +1051,10 @@ def render_holdings():
     def _holdings_fragment():
         holdings = database.get_holdings()
         
+        # Show the result of the last management action (queued before the fragment rerun)
+        if 'holdings_toast' in st.session_state:
+            st.toast(st.session_state.pop('holdings_toast'), icon='✅')
+        
         # Check if we should skip API fetching (Auto-refresh ON but NOT trading time)
         skip_api = auto_refresh and not logic.is_trading_time()
         
@@ -1138,11 +1166,14 @@ def render_holdings():
                 
                 chart_cols = st.columns(3) # Grid layout
                 
+                # Local DB ticks for every holding in one query
+                today_ticks = database.get_today_ticks_multi(holdings['fund_code'].tolist())
+                
                 for idx, row in holdings.iterrows():
                     fund_code = row['fund_code']
                     
                     # 1. Try to get Local DB Data (Continuous Accumulation)
-                    db_df = database.get_today_ticks(fund_code)
+                    db_df = today_ticks.get(fund_code, pd.DataFrame())
                     
                     # 2. Get API Trend for basic coverage
                     trend_data = batch_trends.get(fund_code, {})
@@ -1153,7 +1184,7 @@ def render_holdings():
                     
                     if not db_df.empty:
                         # Use Local DB Data as the primary source for the chart
-                        times = pd.to_datetime(db_df['record_time']).dt.strftime('%H:%M:%S').tolist()
+                        times = db_df['record_time'].dt.strftime('%H:%M:%S').tolist()
                         pcts = db_df['pct'].tolist()
                         
                         # Merge with API data if API has more points (e.g., historical morning data)
@@ -1241,123 +1272,112 @@ def render_holdings():
             m_col1, m_col2, m_col3 = st.columns(3)
             
             # Create a list of options for the selectbox: "ID: FundName (Code)"
-            mgmt_options = holdings.apply(lambda x: f"{x['id']} : {x['fund_name']} ({x['fund_code']})", axis=1).tolist()
+            # and an id -> row lookup in the same pass over the holdings
+            mgmt_options = []
+            holding_rows = {}
+            for r in holdings.itertuples(index=False):
+                mgmt_options.append(f"{r.id} : {r.fund_name} ({r.fund_code})")
+                holding_rows[r.id] = r
             
-            with m_col1:
-                with st.expander("🔄 加仓 / 减仓 (交易录入)", expanded=True):
-                    if mgmt_options:
-                        selected_to_trade = st.selectbox("选择交易基金", options=mgmt_options, key="trade_select")
-                        trade_id = int(selected_to_trade.split(' : ')[0])
-                        trade_row = holdings[holdings['id'] == trade_id].iloc[0]
-                        trade_fund_code = trade_row['fund_code']
-                        
-                        # Fetch Real-time Estimate for Default Price
-                        est_price = 0.0
-                        if batch_data and trade_fund_code in batch_data:
-                            est_price = batch_data[trade_fund_code]['gz']
-                        elif display_df is not None:
-                            # Fallback to display_df (which might be from session state)
-                            match = display_df[display_df['fund_code'] == trade_fund_code]
-                            if not match.empty:
-                                est_price = match.iloc[0]['最新净值']
-                        
-                        trade_type = st.radio("交易方向", ["加仓 (买入)", "减仓 (卖出)"], horizontal=True)
-                        
-                        # Effective Date Logic
-                        eff_date = logic.get_effective_trading_date()
-                        st.caption(f"📅 有效净值日期: **{eff_date}** (根据 15:00 规则判定)")
-                        
-                        with st.form("trade_form"):
-                            # Ensure value is at least min_value to avoid StreamlitValueBelowMinError
-                            default_t_price = max(0.0001, float(est_price))
-                            t_price = st.number_input("成交净值 (元)", value=default_t_price, min_value=0.0001, step=0.0001, format="%.4f", help="默认为当前实时估值，可手动修正为确认净值")
-                            
-                            if "加仓" in trade_type:
-                                t_amount = st.number_input("买入金额 (元)", min_value=0.0, step=100.0, format="%.2f")
-                                # Calculate estimated shares for display
-                                est_share = t_amount / t_price if t_price > 0 else 0
-                                st.markdown(f"📏 预估增加份额: **{est_share:.2f}**")
-                            else:
-                                t_share = st.number_input("卖出份额", min_value=0.0, max_value=float(trade_row['share']), step=10.0, format="%.2f")
-                                # Calculate estimated return amount
-                                est_return = t_share * t_price
-                                st.markdown(f"💰 预估回款金额: **{est_return:.2f}** 元")
-                            
-                            if st.form_submit_button("🚀 确认交易"):
-                                old_share = trade_row['share']
-                                old_cost = trade_row['cost_price']
-                                
-                                if "加仓" in trade_type:
-                                    # Buy: Input is Amount
-                                    # Calculate share delta
-                                    share_delta = t_amount / t_price if t_price > 0 else 0
-                                    new_share, new_cost = logic.calculate_new_cost(old_share, old_cost, share_delta, t_price, "buy")
-                                    
-                                    database.update_holding(trade_id, new_share, new_cost)
-                                    msg = f"已加仓 {t_amount}元 (约 {share_delta:.2f}份)。\n最新持仓: {new_share:.2f}份, 成本: {new_cost:.4f}"
-                                else:
-                                    # Sell: Input is Share
-                                    new_share, new_cost = logic.calculate_new_cost(old_share, old_cost, t_share, t_price, "sell")
-                                    
-                                    database.update_holding(trade_id, new_share, new_cost)
-                                    msg = f"已减仓 {t_share}份。\n最新持仓: {new_share:.2f}份, 成本: {new_cost:.4f}"
-                                
-                                # Clear cache
-                                if 'last_holdings_display' in st.session_state: del st.session_state['last_holdings_display']
-                                if 'last_dashboard_data' in st.session_state: del st.session_state['last_dashboard_data']
-                                
-                                st.success(msg)
-                                time.sleep(1.5)
+            def _mgmt_panel(col, title, select_label, key, empty_caption, body_fn):
+                """
+                Shared shell for the management panels: expander + holding selectbox.
+                body_fn(holding_id, row, selected) renders the inputs and returns a toast
+                message once the action has been applied to the DB, otherwise None.
+                """
+                with col:
+                    with st.expander(title, expanded=True):
+                        if not mgmt_options:
+                            st.caption(empty_caption)
+                            return
+                        selected = st.selectbox(select_label, options=mgmt_options, key=key)
+                        holding_id = int(selected.split(' : ')[0])
+                        msg = body_fn(holding_id, holding_rows[holding_id], selected)
+                        if msg:
+                            # Clear cache to force refresh with new DB values
+                            st.session_state.pop('last_holdings_display', None)
+                            st.session_state.pop('last_dashboard_data', None)
+                            st.session_state['holdings_toast'] = msg
+                            try:
+                                st.rerun(scope="fragment")
+                            except StreamlitAPIException:
+                                # Not inside a fragment rerun (e.g. triggered by a full app run)
                                 st.rerun()
+
+            def _trade_body(trade_id, trade_row, selected):
+                trade_fund_code = trade_row.fund_code
+                
+                # Fetch Real-time Estimate for Default Price
+                est_price = 0.0
+                if batch_data and trade_fund_code in batch_data:
+                    est_price = batch_data[trade_fund_code]['gz']
+                elif display_df is not None:
+                    # Fallback to display_df (which might be from session state)
+                    match = display_df[display_df['fund_code'] == trade_fund_code]
+                    if not match.empty:
+                        est_price = match.iloc[0]['最新净值']
+                
+                trade_type = st.radio("交易方向", ["加仓 (买入)", "减仓 (卖出)"], horizontal=True)
+                
+                # Effective Date Logic
+                eff_date = logic.get_effective_trading_date()
+                st.caption(f"📅 有效净值日期: **{eff_date}** (根据 15:00 规则判定)")
+                
+                with st.form("trade_form"):
+                    # Ensure value is at least min_value to avoid StreamlitValueBelowMinError
+                    default_t_price = max(0.0001, float(est_price))
+                    t_price = st.number_input("成交净值 (元)", value=default_t_price, min_value=0.0001, step=0.0001, format="%.4f", help="默认为当前实时估值，可手动修正为确认净值")
+                    
+                    if "加仓" in trade_type:
+                        t_amount = st.number_input("买入金额 (元)", min_value=0.0, step=100.0, format="%.2f")
+                        # Calculate estimated shares for display
+                        est_share = t_amount / t_price if t_price > 0 else 0
+                        st.markdown(f"📏 预估增加份额: **{est_share:.2f}**")
                     else:
-                        st.caption("暂无持仓可交易")
-
-            with m_col2:
-                with st.expander("📝 修正持仓 (手动)", expanded=True):
-                    if mgmt_options:
-                        selected_to_edit = st.selectbox("选择要修正的持仓", options=mgmt_options, key="edit_select")
-                        # Get current values for pre-filling
-                        edit_id = int(selected_to_edit.split(' : ')[0])
-                        current_row = holdings[holdings['id'] == edit_id].iloc[0]
+                        t_share = st.number_input("卖出份额", min_value=0.0, max_value=float(trade_row.share), step=10.0, format="%.2f")
+                        # Calculate estimated return amount
+                        est_return = t_share * t_price
+                        st.markdown(f"💰 预估回款金额: **{est_return:.2f}** 元")
+                    
+                    if st.form_submit_button("🚀 确认交易"):
+                        old_share = trade_row.share
+                        old_cost = trade_row.cost_price
                         
-                        with st.form("edit_holding_form"):
-                            new_share = st.number_input("调整后份额", value=float(current_row['share']), step=0.01, format="%.2f")
-                            new_cost = st.number_input("调整后持仓成本 (元)", value=float(current_row['cost_price']), step=0.0001, format="%.4f")
+                        if "加仓" in trade_type:
+                            # Buy: Input is Amount
+                            # Calculate share delta
+                            share_delta = t_amount / t_price if t_price > 0 else 0
+                            new_share, new_cost = logic.calculate_new_cost(old_share, old_cost, share_delta, t_price, is_buy=True)
                             
-                            if st.form_submit_button("✅ 确认修正", use_container_width=True):
-                                database.update_holding(edit_id, new_share, new_cost)
-                                # Clear cache to force refresh with new DB values
-                                if 'last_holdings_display' in st.session_state:
-                                    del st.session_state['last_holdings_display']
-                                if 'last_dashboard_data' in st.session_state:
-                                    del st.session_state['last_dashboard_data']
-                                
-                                st.success(f"已更新 {current_row['fund_name']} 的持仓数据")
-                                time.sleep(1)
-                                st.rerun()
-                    else:
-                        st.caption("暂无持仓可修改")
-
-            with m_col3:
-                with st.expander("🗑️ 删除持仓", expanded=True):
-                    if mgmt_options:
-                        selected_to_delete = st.selectbox("选择要删除的持仓", options=mgmt_options, key="delete_select")
+                            database.update_holding(trade_id, new_share, new_cost)
+                            return f"已加仓 {t_amount}元 (约 {share_delta:.2f}份)。\n最新持仓: {new_share:.2f}份, 成本: {new_cost:.4f}"
                         
-                        if st.button("🗑️ 确认删除", use_container_width=True):
-                            # Extract ID from the selection string
-                            del_id = int(selected_to_delete.split(' : ')[0])
-                            database.delete_holding(del_id)
-                            # Clear cache to force refresh with new DB values
-                            if 'last_holdings_display' in st.session_state:
-                                del st.session_state['last_holdings_display']
-                            if 'last_dashboard_data' in st.session_state:
-                                del st.session_state['last_dashboard_data']
-                                
-                            st.success(f"已删除持仓: {selected_to_delete}")
-                            time.sleep(1) # Give user a moment to see the success message
-                            st.rerun()
-                    else:
-                        st.caption("暂无持仓可删除")
+                        # Sell: Input is Share
+                        new_share, new_cost = logic.calculate_new_cost(old_share, old_cost, t_share, t_price, is_buy=False)
+                        
+                        database.update_holding(trade_id, new_share, new_cost)
+                        return f"已减仓 {t_share}份。\n最新持仓: {new_share:.2f}份, 成本: {new_cost:.4f}"
+                return None
+
+            def _edit_body(edit_id, current_row, selected):
+                with st.form("edit_holding_form"):
+                    new_share = st.number_input("调整后份额", value=float(current_row.share), step=0.01, format="%.2f")
+                    new_cost = st.number_input("调整后持仓成本 (元)", value=float(current_row.cost_price), step=0.0001, format="%.4f")
+                    
+                    if st.form_submit_button("✅ 确认修正", use_container_width=True):
+                        database.update_holding(edit_id, new_share, new_cost)
+                        return f"已更新 {current_row.fund_name} 的持仓数据"
+                return None
+
+            def _delete_body(del_id, row, selected):
+                if st.button("🗑️ 确认删除", use_container_width=True):
+                    database.delete_holding(del_id)
+                    return f"已删除持仓: {selected}"
+                return None
+
+            _mgmt_panel(m_col1, "🔄 加仓 / 减仓 (交易录入)", "选择交易基金", "trade_select", "暂无持仓可交易", _trade_body)
+            _mgmt_panel(m_col2, "📝 修正持仓 (手动)", "选择要修正的持仓", "edit_select", "暂无持仓可修改", _edit_body)
+            _mgmt_panel(m_col3, "🗑️ 删除持仓", "选择要删除的持仓", "delete_select", "暂无持仓可删除", _delete_body)
             
         else:
             st.info("暂无持仓。")
@@ -1372,6 +1392,8 @@ def render_holdings():
 
 # --- Page: Investment Plan ---
 def render_plan():
+    import plotly.graph_objects as go
+
     st.title("📅 智能定投规划")
     
     tab1, tab2 = st.tabs(["🎯 创建计划 & 测算", "📋 我的定投"])
@@ -1401,13 +1423,14 @@ def render_plan():
                     # Use new calculation logic
                     res = logic.calculate_sip_returns(fund_code, amount, freq, duration, execution_day)
                     if res:
-                        st.session_state['plan_result'] = res
-                        st.session_state['plan_params'] = {
+                        # Keep the inputs with the result so the save handler uses what was tested
+                        res['params'] = {
                             'fund_code': fund_code,
                             'amount': amount,
                             'freq': freq,
                             'execution_day': execution_day
                         }
+                        st.session_state['plan_result'] = res
                     else:
                         st.error("获取基金数据失败或数据不足，无法测算。")
         
@@ -1417,6 +1440,10 @@ def render_plan():
             if 'plan_result' in st.session_state and st.session_state['plan_result']:
                 res = st.session_state['plan_result']
                 
+                # Keep trends as float arrays so plotly serializes them without walking lists
+                for k in ('optimistic', 'neutral', 'pessimistic'):
+                    res[k]['trend'] = np.asarray(res[k]['trend'], dtype=np.float64)
+                
                 # Plot
                 fig = go.Figure()
                 
@@ -1430,7 +1457,7 @@ def render_plan():
                 # Re-calculate x-axis for invested base line
                 total_periods = len(res['neutral']['trend'])
                 step_amount = res['neutral']['total_invested'] / total_periods if total_periods > 0 else amount
-                fig.add_trace(go.Scatter(y=[step_amount * (i+1) for i in range(total_periods)], mode='lines', name='本金投入', line=dict(color='#666666')))
+                fig.add_trace(go.Scatter(y=step_amount * np.arange(1, total_periods + 1), mode='lines', name='本金投入', line=dict(color='#666666')))
                 
                 fig.update_layout(title="定投收益模拟曲线 (基于真实历史)", xaxis_title="期数", yaxis_title="资产总值", template='plotly_dark')
                 st.plotly_chart(fig, width='stretch')
@@ -1438,7 +1465,7 @@ def render_plan():
                 st.info(f"📊 **历史实测**: 坚持定投 {duration} 年，累计投入 {res['neutral']['total_invested']:.0f} 元，期末持有市值 **{res['neutral']['final_value']:.2f}** 元 (收益率 {res['neutral']['yield_rate']*100:.2f}%)")
                 
                 if st.button("保存该计划"):
-                    params = st.session_state.get('plan_params', {})
+                    params = res['params']
                     # Try to fetch fund name
                     try:
                         info = data_api.get_fund_basic_info(params['fund_code'])
@@ -1446,32 +1473,49 @@ def render_plan():
                     except:
                         f_name = '未命名基金'
                         
-                    database.add_plan(params['fund_code'], f_name, params['amount'], params['freq'], params['execution_day'], datetime.datetime.now().strftime("%Y-%m-%d"))
+                    database.add_plan(params['fund_code'], f_name, params['amount'], params['freq'], params['execution_day'], datetime.date.today().isoformat())
                     st.success("计划已保存！请切换到“我的定投”查看。")
     
     with tab2:
         st.subheader("📋 我的定投计划")
         plans = database.get_plans()
         if not plans.empty:
-            for idx, row in plans.iterrows():
-                with st.container(border=True):
-                    c_info, c_act = st.columns([3, 1])
-                    with c_info:
-                        exec_day = row['execution_day']
-                        if row['frequency'] == '每周':
-                            try:
-                                day_str = f"周{['一','二','三','四','五'][int(exec_day)-1]}"
-                            except:
-                                day_str = "周一(默认)"
-                        else:
-                            day_str = f"每月{exec_day}日" if exec_day else "每月1日(默认)"
-                            
-                        st.markdown(f"**{row['fund_name']}** ({row['fund_code']})")
-                        st.caption(f"定投: {row['amount']}元 | 频率: {row['frequency']} ({day_str}) | 开始时间: {row['start_date']}")
-                    with c_act:
-                        if st.button("删除", key=f"del_plan_{row['id']}"):
-                            database.delete_plan(row['id'])
-                            st.rerun()
+            def _day_str(freq, exec_day):
+                if freq == '每周':
+                    try:
+                        return f"周{['一','二','三','四','五'][int(exec_day)-1]}"
+                    except:
+                        return "周一(默认)"
+                return f"每月{exec_day}日" if exec_day else "每月1日(默认)"
+
+            # One editable table instead of a container + button per plan
+            plans_display = plans.assign(
+                day_str=[_day_str(f, d) for f, d in zip(plans['frequency'], plans['execution_day'])],
+                action=False
+            )[['id', 'fund_name', 'fund_code', 'amount', 'frequency', 'day_str', 'start_date', 'action']]
+
+            edited = st.data_editor(
+                plans_display,
+                column_config={
+                    'id': None,
+                    'fund_name': "基金名称",
+                    'fund_code': "代码",
+                    'amount': st.column_config.NumberColumn("定投金额", format="%.0f 元"),
+                    'frequency': "频率",
+                    'day_str': "扣款日",
+                    'start_date': "开始时间",
+                    'action': st.column_config.CheckboxColumn("🗑️ 删除", default=False),
+                },
+                disabled=['fund_name', 'fund_code', 'amount', 'frequency', 'day_str', 'start_date'],
+                hide_index=True,
+                width='stretch',
+                key="plans_editor"
+            )
+
+            selected_ids = edited.loc[edited['action'], 'id'].tolist()
+            if st.button(f"删除选中计划 ({len(selected_ids)})", disabled=not selected_ids):
+                database.delete_plans(selected_ids)
+                st.rerun()
         else:
             st.info("暂无定投计划。")
 
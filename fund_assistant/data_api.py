@@ -1,12 +1,25 @@
 import akshare as ak
 import pandas as pd
+import numpy as np
 import datetime
 import streamlit as st
 import concurrent.futures
 import requests
-import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.exceptions import NewConnectionError
 import json
+import re
+try:
+    import orjson  # Optional: decodes JSON straight from bytes, much faster than json
+except ImportError:
+    orjson = None
 import threading
+import io
+import atexit
+import os
+import pickle
+from operator import itemgetter
 
 # Global lock for akshare calls to prevent py_mini_racer (V8) crashes in multi-threaded environments
 ak_lock = threading.Lock()
@@ -18,6 +31,95 @@ def safe_ak_call(func, *args, **kwargs):
     with ak_lock:
         return func(*args, **kwargs)
 
+def _json_loads(data):
+    """Decode JSON from str/bytes with orjson when available, else the stdlib json."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# --- Shared HTTP Session ---
+# One pooled session for every HTTP call so TCP/TLS connections to the few quote hosts
+# (Sina, Tiantian, EastMoney) are reused. pool_maxsize stays above the thread pool sizes.
+_SESSION = requests.Session()
+
+class _FastFailRetry(Retry):
+    """
+    Retry that only counts connections that failed fast (refused, DNS error) as retryable
+    connect errors. urllib3 also treats connect *timeouts* as connect errors, and since every
+    call passes one scalar timeout= (which is the connect timeout too), retrying those would
+    multiply the 1-2s quote budgets; with other=0 they are raised at once instead.
+    _is_connection_error is private urllib3 API, hence the urllib3 major pin in requirements.txt.
+    """
+    def _is_connection_error(self, err):
+        return isinstance(getattr(err, 'original_error', err), NewConnectionError)
+
+# Retries, all without Retry-After sleeps (a 1s auto-refresh must never wait on a server hint):
+# - refused/unresolvable connections: up to 2 more tries; these fail in milliseconds, so the
+#   worst case adds only the backoff (~0.4s)
+# - 429/5xx: one more try; worst case about 2x the call's timeout, only if the error reply
+#   itself was that slow
+# - connect and read timeouts: never retried, so an unreachable host costs exactly one timeout
+_HTTP_RETRY = _FastFailRetry(
+    total=2, connect=2, read=0, status=1, other=0,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({'GET'}),
+    backoff_factor=0.2,
+    respect_retry_after_header=False,
+    raise_on_status=False,
+)
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=_HTTP_RETRY)
+_SESSION.mount('http://', _HTTP_ADAPTER)
+_SESSION.mount('https://', _HTTP_ADAPTER)
+_SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    # Compressed bodies (kline/trend JSON, history scripts); urllib3 decodes transparently
+    "Accept-Encoding": "gzip, deflate"
+})
+
+# Persistent worker pool for all parallel network fetches (avoids spawning threads per call)
+_IO_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix='fund-io')
+atexit.register(_IO_POOL.shutdown, wait=False)
+
+# Small separate pool for hedged (raced) single-fund requests, so a caller already running
+# on _IO_POOL can never block waiting for its own pool
+_HEDGE_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix='fund-hedge')
+atexit.register(_HEDGE_POOL.shutdown, wait=False)
+
+# At most this many history downloads in flight at once (EastMoney throttles bursts)
+HISTORY_FETCH_CONCURRENCY = 8
+_history_fetch_slots = threading.BoundedSemaphore(HISTORY_FETCH_CONCURRENCY)
+
+# Per-request timeout when racing Sina against Tiantian
+HEDGE_TIMEOUT = 1.0
+
+# One Sina quote line: var hq_str_<symbol>="<comma separated fields>";
+_HQ_RE = re.compile(r'var hq_str_(\w+)="([^"]*)";')
+
+# Per-host Referer headers (Sina rejects requests without it)
+SINA_HEADERS = {"Referer": "https://finance.sina.com.cn/"}
+EM_HEADERS = {"Referer": "http://quote.eastmoney.com/"}
+EM_FUND_HEADERS = {"Referer": "https://fund.eastmoney.com/"}
+
+# URL templates; only the code / secid / period is filled in per request
+SINA_HQ_URL = "http://hq.sinajs.cn/list={}"
+EM_PINGZHONG_URL = "https://fund.eastmoney.com/pingzhongdata/{}.js"
+TIANTIAN_GZ_URL = "http://fundgz.1234567.com.cn/js/{}.js"
+# f51: time, f53: price
+EM_TRENDS_URL = ("http://push2.eastmoney.com/api/qt/stock/trends2/get?secid={secid}"
+                 "&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f53&iscr=0")
+# f51: date, f52: open, f53: close, f54: high, f55: low, f56: vol, f57: amount, f58: amplitude
+EM_KLINE_URL = ("http://push2his.eastmoney.com/api/qt/stock/kline/get?secid={secid}"
+                "&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f52,f53,f54,f55,f56,f57,f58"
+                "&klt={period}&fqt=1&end=20500101&lmt=120")
+
+# Response bodies are decoded with their known charset: resp.text falls back to charset
+# sniffing (charset_normalizer over the whole body) when the server sends no charset.
+# Sina serves GBK (decoded as its superset GB18030); EastMoney/Tiantian serve UTF-8.
+SINA_ENCODING = 'gb18030'
+
+def _resp_text(resp, encoding='utf-8'):
+    return resp.content.decode(encoding, errors='replace')
+
 # --- Cached Data Fetching Functions ---
 
 @st.cache_data(ttl=86400) # Cache for 24 hours
@@ -26,133 +128,339 @@ def _fetch_all_fund_names():
     Fetch list of all funds. Heavy payload (~10MB+).
     """
     try:
-        return safe_ak_call(ak.fund_name_em)
+        df = safe_ak_call(ak.fund_name_em)
+        if not df.empty:
+            # Lowercased names precomputed once for case-insensitive search
+            df['_name_lower'] = df['基金简称'].str.lower()
+        return df
     except Exception as e:
         print(f"Error fetching fund names: {e}")
         return pd.DataFrame()
 
+@st.cache_resource(ttl=86400) # Shared, read-only: avoids cache_data copying the dict on every lookup
+def _fetch_fund_names_index():
+    """
+    Build a {code: (name, type)} index over the full fund list for O(1) code lookups.
+    """
+    df = _fetch_all_fund_names()
+    if df.empty:
+        return {}
+    return dict(zip(df['基金代码'], zip(df['基金简称'], df['基金类型'])))
+
+def _fetch_fund_history_direct(fund_code):
+    """
+    Fetch full NAV history straight from EastMoney's pingzhongdata script.
+    This is the same source akshare uses, but we slice the Data_netWorthTrend JSON array
+    out of the script text instead of evaluating it in V8, so no ak_lock is needed.
+    Returns DataFrame ['净值日期', '单位净值', '日增长率'] (empty on failure).
+    """
+    resp = _SESSION.get(EM_PINGZHONG_URL.format(fund_code), headers=EM_FUND_HEADERS, timeout=5.0)
+    if resp.status_code != 200:
+        return pd.DataFrame()
+    
+    # Format: var Data_netWorthTrend = [{"x":1577808000000,"y":1.0,"equityReturn":0,"unitMoney":""},...];
+    content = _resp_text(resp)
+    pos = content.find('Data_netWorthTrend')
+    if pos < 0:
+        return pd.DataFrame()
+    start = content.find('[', pos)
+    end = content.find('];', start)
+    if start < 0 or end < 0:
+        return pd.DataFrame()
+    
+    df = pd.DataFrame(_json_loads(content[start:end + 1]))
+    if df.empty:
+        return df
+    # x is epoch ms (UTC); shift to Beijing time before taking the date
+    df = pd.DataFrame({
+        '净值日期': pd.to_datetime(df['x'] + 8 * 3600 * 1000, unit='ms').dt.normalize(),
+        '单位净值': pd.to_numeric(df['y'], errors='coerce'),
+        '日增长率': pd.to_numeric(df['equityReturn'], errors='coerce'),
+    })
+    return df
+
+# --- On-disk NAV history cache ---
+# Survives Streamlit restarts so histories aren't re-downloaded for every fund on cold start.
+NAV_CACHE_DIR = os.path.join('.cache', 'nav')
+
+def nav_cache_bucket():
+    """
+    Cache bucket for today's history. NAVs are published in the evening, so before
+    20:00 one bucket covers the whole day; after that, refresh hourly.
+    Also keys the diagnosis cache in logic, so results refresh together with the NAVs.
+    """
+    now = datetime.datetime.now()
+    if now.hour < 20:
+        return now.strftime("%Y%m%d")
+    return now.strftime("%Y%m%d-%H")
+
+def _load_nav_cache(fund_code):
+    path = os.path.join(NAV_CACHE_DIR, f"{fund_code}_{nav_cache_bucket()}.pkl")
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading NAV cache for {fund_code}: {e}")
+        return None
+
+def _save_nav_cache(fund_code, df):
+    fname = f"{fund_code}_{nav_cache_bucket()}.pkl"
+    try:
+        os.makedirs(NAV_CACHE_DIR, exist_ok=True)
+        path = os.path.join(NAV_CACHE_DIR, fname)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        
+        # Drop this fund's files from older buckets
+        for old in os.listdir(NAV_CACHE_DIR):
+            if old.startswith(f"{fund_code}_") and old != fname and old.endswith('.pkl'):
+                os.remove(os.path.join(NAV_CACHE_DIR, old))
+    except Exception as e:
+        print(f"Error writing NAV cache for {fund_code}: {e}")
+
 @st.cache_data(ttl=3600) # Cache for 1 hour
 def _fetch_fund_history_raw(fund_code):
     """
-    Fetch full history for a fund.
+    Fetch full history for a fund, sorted ascending by 净值日期.
+    Layers: st.cache_data (in-process) -> disk cache -> network.
+    """
+    df = _load_nav_cache(fund_code)
+    if df is not None:
+        return df
+    
+    with _history_fetch_slots:
+        df = _fetch_fund_history_network(fund_code)
+    if not df.empty:
+        _save_nav_cache(fund_code, df)
+    return df
+
+def _normalize_nav_history(df):
+    """
+    Pin the history's dtypes once, before it is cached (datetime64[ns] dates, float64 NAV / growth),
+    so every consumer's NAV * share is a plain float64 vector op, never an object-column conversion.
     """
+    df = df.astype({'净值日期': 'datetime64[ns]', '单位净值': 'float64'})
+    if '日增长率' in df.columns and df['日增长率'].dtype != 'float64':
+        df['日增长率'] = pd.to_numeric(df['日增长率'], errors='coerce').astype('float64')
+    return df.sort_values('净值日期', ignore_index=True)
+
+def _fetch_fund_history_network(fund_code):
+    """
+    Download full history for a fund, sorted ascending by 净值日期.
+    Tries the direct EastMoney endpoint first, akshare (V8, serialized by ak_lock) as fallback.
+    """
+    try:
+        df = _fetch_fund_history_direct(fund_code)
+        if not df.empty:
+            return _normalize_nav_history(df)
+    except Exception as e:
+        print(f"Direct history fetch failed for {fund_code}, falling back to akshare: {e}")
+    
     try:
         df = safe_ak_call(ak.fund_open_fund_info_em, symbol=fund_code, indicator="单位净值走势")
         if not df.empty:
             df['净值日期'] = pd.to_datetime(df['净值日期'])
-            df['单位净值'] = df['单位净值'].astype(float)
-            return df
+            return _normalize_nav_history(df)
     except Exception as e:
         print(f"Error fetching history raw for {fund_code}: {e}")
     return pd.DataFrame()
 
-def _fetch_single_fund_realtime(fund_code):
+# Exchange-traded funds (ETF/LOF) are quoted by Sina; everything else uses Tiantian estimates
+EXCHANGE_FUND_PREFIXES = ('15', '16', '18', '50', '51', '56', '58')
+# Set forms for per-code checks: code[:2] / code[:1] membership instead of startswith(tuple)
+_EXCHANGE_PREFIX_SET = frozenset(EXCHANGE_FUND_PREFIXES)
+_SH_FIRST_DIGITS = frozenset('56')  # Shanghai-listed funds start with 5 (or 6)
+
+def _is_exchange_fund(fund_code):
+    return fund_code[:2] in _EXCHANGE_PREFIX_SET
+
+# Max symbols per Sina list= request
+SINA_BATCH_SIZE = 40
+
+def _sina_fund_symbol(fund_code):
+    """Map an exchange fund code to its Sina symbol (sh/sz prefix)."""
+    if fund_code[:1] in _SH_FIRST_DIGITS:
+        return f"sh{fund_code}"
+    return f"sz{fund_code}"
+
+# Sina quote fields used for fund estimates: 2: pre_close, 3: price, 30: date, 31: time
+_SINA_FUND_FIELDS = itemgetter(2, 3, 30, 31)
+
+def _parse_sina_fund_quote(fund_code, data_str):
     """
-    Fetch real-time estimation/price for a SINGLE fund.
-    For on-exchange funds (ETF/LOF), prioritize Sina Finance API (EastMoney is blocking).
-    For off-exchange funds, use Tiantian Fund Estimation API.
+    Parse one Sina quote payload ("name,open,pre_close,price,...") into our estimate dict.
+    Returns None if the payload is empty or malformed.
     """
-    is_exchange = fund_code.startswith(('15', '16', '18', '50', '51', '56', '58'))
+    if len(data_str) <= 10:
+        return None
+    parts = data_str.split(',')
+    if len(parts) <= 30:
+        return None
     
-    # --- Try Sina Finance API first for exchange funds ---
-    if is_exchange:
-        try:
-            # Determine prefix
-            if fund_code.startswith(('5', '6')):
-                symbol = f"sh{fund_code}"
-            else:
-                symbol = f"sz{fund_code}"
-                
-            sina_url = f"http://hq.sinajs.cn/list={symbol}"
-            headers = {
-                "Referer": "https://finance.sina.com.cn/"
-            }
-            s_resp = requests.get(sina_url, headers=headers, timeout=2.0)
-            
-            if s_resp.status_code == 200:
-                content = s_resp.text
-                # Format: var hq_str_sz161226="name,open,pre_close,price,..."
-                if "=" in content:
-                    data_str = content.split('=')[1].strip().strip('";')
-                    if len(data_str) > 10:
-                        parts = data_str.split(',')
-                        if len(parts) > 30:
-                            # Parse fields
-                            # 0: name, 1: open, 2: pre_close, 3: price
-                            pre_close = float(parts[2])
-                            price = float(parts[3])
-                            
-                            # If price is 0 (e.g. before open), use pre_close
-                            current_price = price if price > 0 else pre_close
-                            
-                            # Calculate percentage
-                            pct = 0.0
-                            if pre_close > 0:
-                                pct = (current_price - pre_close) / pre_close * 100
-                            
-                            # Date/Time (30: date, 31: time)
-                            data_date = parts[30]
-                            data_time = parts[31]
-                            
-                            return {
-                                'code': fund_code,
-                                'gz': round(current_price, 4),
-                                'zzl': round(pct, 2),
-                                'est_date': data_date,
-                                'pre_close': round(pre_close, 4),
-                                'confirmed_nav': round(pre_close, 4),
-                                'time': data_time
-                            }
-        except Exception:
-            pass
+    # Parse fields (one C-level fetch of the four fields we use)
+    pre_close, price, data_date, data_time = _SINA_FUND_FIELDS(parts)
+    pre_close = float(pre_close)
+    price = float(price)
+    
+    # If price is 0 (e.g. before open), use pre_close
+    current_price = price if price > 0 else pre_close
+    
+    # Calculate percentage
+    pct = 0.0
+    if pre_close > 0:
+        pct = (current_price - pre_close) / pre_close * 100
+    
+    return {
+        'code': fund_code,
+        'gz': round(current_price, 4),
+        'zzl': round(pct, 2),
+        'est_date': data_date,
+        'pre_close': round(pre_close, 4),
+        'confirmed_nav': round(pre_close, 4),
+        'time': data_time
+    }
 
-    # --- Fallback or Default to Tiantian Fund API ---
-    url = f"http://fundgz.1234567.com.cn/js/{fund_code}.js"
+def _fetch_sina_fund_quotes(fund_codes, timeout=2.0):
+    """
+    Fetch Sina quotes for several exchange funds with ONE request (list=sym1,sym2,...).
+    Returns a dict {code: estimate_dict} for the codes that parsed successfully.
+    """
+    results = {}
+    symbol_to_code = {_sina_fund_symbol(code): code for code in fund_codes}
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        }
-        resp = requests.get(url, headers=headers, timeout=1.5)
+        sina_url = SINA_HQ_URL.format(','.join(symbol_to_code))
+        s_resp = _SESSION.get(sina_url, headers=SINA_HEADERS, timeout=timeout)
+        if s_resp.status_code != 200:
+            return results
+        
+        # Format: one line per symbol -> var hq_str_sz161226="name,open,pre_close,price,...";
+        for m in _HQ_RE.finditer(_resp_text(s_resp, SINA_ENCODING)):
+            code = symbol_to_code.get(m.group(1))
+            if not code:
+                continue
+            try:
+                quote = _parse_sina_fund_quote(code, m.group(2))
+                if quote:
+                    results[code] = quote
+            except (ValueError, IndexError):
+                pass
+    except Exception:
+        pass
+    return results
+
+# fundgz payload fields: code, estimate, estimate change %, last NAV, "YYYY-MM-DD HH:MM"
+_TIANTIAN_FIELDS = itemgetter('fundcode', 'gsz', 'gszzl', 'dwjz', 'gztime')
+
+def _fetch_tiantian_estimate(fund_code, timeout=1.5):
+    """
+    Fetch the Tiantian Fund real-time estimation for a single fund.
+    """
+    url = TIANTIAN_GZ_URL.format(fund_code)
+    try:
+        resp = _SESSION.get(url, timeout=timeout)
         
         if resp.status_code == 200:
-            content = resp.text
-            match = re.search(r'jsonpgz\((.*)\);', content)
-            if match and match.group(1):
-                data = json.loads(match.group(1))
+            content = _resp_text(resp)
+            # Payload is always jsonpgz({...}); -> slice out the JSON between the outer parentheses
+            payload = content[content.find('(') + 1:content.rfind(')')]
+            if payload:
+                code, gz, zzl, dwjz, gztime = _TIANTIAN_FIELDS(_json_loads(payload))
+                est_date, est_time = gztime.split(' ')[:2]
                 return {
-                    'code': data['fundcode'],
-                    'gz': data['gsz'],
-                    'zzl': data['gszzl'],
-                    'est_date': data['gztime'].split(' ')[0],
-                    'pre_close': data['dwjz'],
-                    'confirmed_nav': data['dwjz'],
-                    'time': data['gztime'].split(' ')[1]
+                    'code': code,
+                    'gz': gz,
+                    'zzl': zzl,
+                    'est_date': est_date,
+                    'pre_close': dwjz,
+                    'confirmed_nav': dwjz,
+                    'time': est_time
                 }
     except Exception:
         pass
         
     return None
 
+def _fetch_single_fund_realtime(fund_code):
+    """
+    Fetch real-time estimation/price for a SINGLE fund.
+    For on-exchange funds (ETF/LOF), Sina Finance (EastMoney is blocking) is preferred; Tiantian
+    is queried alongside it and only used if Sina fails or hasn't answered within HEDGE_TIMEOUT.
+    The two aren't interchangeable (Sina: market price, confirmed_nav = pre_close; Tiantian:
+    NAV estimate, confirmed_nav = last NAV), so the source must not depend on which is faster.
+    For off-exchange funds, use Tiantian Fund Estimation API.
+    """
+    # --- Exchange funds: Sina, with Tiantian hedged in the background ---
+    if _is_exchange_fund(fund_code):
+        sina_future = _HEDGE_POOL.submit(lambda: _fetch_sina_fund_quotes([fund_code], HEDGE_TIMEOUT).get(fund_code))
+        tt_future = _HEDGE_POOL.submit(_fetch_tiantian_estimate, fund_code, HEDGE_TIMEOUT)
+        done, _ = concurrent.futures.wait([sina_future], timeout=HEDGE_TIMEOUT)
+        if done:
+            result = sina_future.result()
+            if result:
+                # Tiantian just finishes in the background; its result is ignored
+                return result
+        result = tt_future.result()
+        if result or done:
+            return result
+        # Tiantian failed while Sina was still pending: take Sina's late answer after all
+        return sina_future.result()
+
+    # --- Off-exchange funds: Tiantian Fund API only ---
+    return _fetch_tiantian_estimate(fund_code)
+
 def get_batch_realtime_estimates(fund_codes):
     """
     Fetch real-time estimates for multiple funds in parallel.
+    Exchange funds are batched into a few Sina list= requests; the rest (and any
+    exchange fund Sina didn't return) go through the per-fund Tiantian API.
     """
     results = {}
     if not fund_codes:
         return results
+    
+    exchange_codes, other_codes = [], []
+    for c in fund_codes:
+        (exchange_codes if _is_exchange_fund(c) else other_codes).append(c)
         
-    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-        future_to_code = {executor.submit(_fetch_single_fund_realtime, code): code for code in fund_codes}
-        for future in concurrent.futures.as_completed(future_to_code):
-            code = future_to_code[future]
-            try:
-                data = future.result()
-                if data:
-                    results[code] = data
-            except Exception:
-                pass
+    sina_futures = [
+        _IO_POOL.submit(_fetch_sina_fund_quotes, exchange_codes[i:i + SINA_BATCH_SIZE])
+        for i in range(0, len(exchange_codes), SINA_BATCH_SIZE)
+    ]
+    future_to_code = {_IO_POOL.submit(_fetch_tiantian_estimate, code): code for code in other_codes}
+        
+    for future in concurrent.futures.as_completed(sina_futures):
+        results.update(future.result())
+        
+    # Exchange funds missing from Sina fall back to Tiantian
+    for code in exchange_codes:
+        if code not in results:
+            future_to_code[_IO_POOL.submit(_fetch_tiantian_estimate, code)] = code
+        
+    for future in concurrent.futures.as_completed(future_to_code):
+        code = future_to_code[future]
+        try:
+            data = future.result()
+            if data:
+                results[code] = data
+        except Exception:
+            pass
     return results
 
+# Column name patterns for ak.fund_value_estimation_em, checked in order (first match wins).
+# The estimate column carries the date, e.g. "2024-01-02-估算数据-估算值".
+_ESTIMATION_COL_PATTERNS = [
+    (re.compile(r'^(\d{4})-(\d{2})-(\d{2}).*估算值'), 'gz'),
+    (re.compile(r'估算值'), 'gz'),
+    (re.compile(r'估算增长率'), 'zzl'),
+    (re.compile(r'基金代码'), 'code'),
+    (re.compile(r'公布数据-单位净值'), 'confirmed_nav'),
+    (re.compile(r'^(?!.*公布数据).*-单位净值$'), 'pre_close'),
+]
+
 @st.cache_data(ttl=60) # Cache for 60 seconds
 def _fetch_realtime_estimations():
     """
@@ -165,27 +473,17 @@ def _fetch_realtime_estimations():
         if not df.empty:
             rename_map = {}
             estimate_date = None
-            pre_close_col = None
-            confirmed_nav_col = None
             
-            # Dynamic column mapping
+            # Dynamic column mapping: one pass over the columns, first matching pattern wins
+            # (confirmed_nav = today's published NAV, pre_close = previous day's NAV)
             for col in df.columns:
-                if "估算值" in col:
-                    rename_map[col] = "gz"
-                    # Extract date
-                    parts = col.split('-')
-                    if len(parts) >= 3:
-                        estimate_date = f"{parts[0]}-{parts[1]}-{parts[2]}"
-                elif "估算增长率" in col:
-                    rename_map[col] = "zzl"
-                elif "基金代码" in col:
-                    rename_map[col] = "code"
-                elif "公布数据-单位净值" in col:
-                    # Today's confirmed NAV
-                    rename_map[col] = "confirmed_nav"
-                elif col.endswith("-单位净值") and "公布数据" not in col:
-                    # Previous day's NAV (Pre-Close)
-                    rename_map[col] = "pre_close"
+                for pattern, target in _ESTIMATION_COL_PATTERNS:
+                    m = pattern.search(col)
+                    if m:
+                        rename_map[col] = target
+                        if m.groups():
+                            estimate_date = "-".join(m.groups())
+                        break
             
             df = df.rename(columns=rename_map)
             
@@ -208,34 +506,18 @@ def _fetch_realtime_estimations():
     return {}
 
 
-def prefetch_data(fund_codes):
-    """
-    Prefetch data for a list of funds in parallel.
-    """
-    # Always fetch real-time estimations first (single call)
-    # We use a ThreadPool to do this alongside history fetching
-    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-        # 1. Real-time estimations (Global)
-        executor.submit(_fetch_realtime_estimations)
-        
-        # 2. Fund Histories (Per Fund)
-        if fund_codes:
-            # Deduplicate codes
-            unique_codes = list(set(fund_codes))
-            for code in unique_codes:
-                executor.submit(_fetch_fund_history_raw, code)
+# s_sh000300 是沪深300指数在新浪的行情代码
+HS300_URL = SINA_HQ_URL.format("s_sh000300")
 
 @st.cache_data(ttl=60)
 def get_market_index():
     """从新浪财经获取沪深300指数实时数据"""
     try:
-        # s_sh000300 是沪深300指数在新浪的行情代码
-        url = "http://hq.sinajs.cn/list=s_sh000300"
-        headers = {"Referer": "https://finance.sina.com.cn/"}
-        resp = requests.get(url, headers=headers, timeout=2.0)
+        url = HS300_URL
+        resp = _SESSION.get(url, headers=SINA_HEADERS, timeout=2.0)
         
         if resp.status_code == 200:
-            content = resp.text
+            content = _resp_text(resp, SINA_ENCODING)
             if "=" in content:
                 # 解析格式: var hq_str_s_sh000300="沪深300,3924.34,-12.45,-0.32,123456,789012";
                 data_str = content.split('=')[1].strip().strip('";')
@@ -252,33 +534,35 @@ def get_market_index():
     
     return {'最新价': 0.0, '涨跌幅': 0.0, '名称': '获取失败'}
 
+# Sina symbol -> display name for the US indices; the request URL never changes
+GLOBAL_INDICES = {
+    'int_dji': '道琼斯',
+    'int_nasdaq': '纳斯达克',
+    'int_sp500': '标普500'
+}
+GLOBAL_INDICES_URL = SINA_HQ_URL.format(",".join(GLOBAL_INDICES))
+
 @st.cache_data(ttl=60)
 def get_global_indices():
     """
     Fetch global indices (S&P 500, Dow Jones, Nasdaq) from Sina.
     """
-    indices = {
-        'int_dji': '道琼斯',
-        'int_nasdaq': '纳斯达克',
-        'int_sp500': '标普500'
-    }
+    indices = GLOBAL_INDICES
     
     results = []
     try:
-        codes = ",".join(indices.keys())
-        url = f"http://hq.sinajs.cn/list={codes}"
-        headers = {"Referer": "https://finance.sina.com.cn/"}
-        resp = requests.get(url, headers=headers, timeout=2.0)
+        resp = _SESSION.get(GLOBAL_INDICES_URL, headers=SINA_HEADERS, timeout=2.0)
         
         if resp.status_code == 200:
-            content = resp.text
+            content = _resp_text(resp, SINA_ENCODING)
             # Format: var hq_str_int_dji="道琼斯,39087.38,90.99,0.23";
+            # Single scan over the response, then emit in our fixed order
+            payloads = {m.group(1): m.group(2) for m in _HQ_RE.finditer(content)}
             
             for code, name in indices.items():
-                if f"var hq_str_{code}=" in content:
+                if code in payloads:
                     try:
-                        line = content.split(f"var hq_str_{code}=\"")[1].split('";')[0]
-                        parts = line.split(',')
+                        parts = payloads[code].split(',')
                         if len(parts) >= 4:
                             results.append({
                                 'name': name, # Use our fixed name or parts[0]
@@ -293,6 +577,16 @@ def get_global_indices():
         
     return results
 
+def get_dashboard_quotes(user_symbols):
+    """
+    HS300, the US indices and the dashboard watchlist (one batched request), fetched concurrently.
+    Returns (market_index, global_indices, {symbol: detail}).
+    """
+    index_future = _IO_POOL.submit(get_market_index)
+    global_future = _IO_POOL.submit(get_global_indices)
+    user_future = _IO_POOL.submit(get_batch_stock_details, user_symbols) if user_symbols else None
+    return index_future.result(), global_future.result(), user_future.result() if user_future else {}
+
 # --- Stock Data API ---
 
 def search_stocks(keyword):
@@ -302,9 +596,9 @@ def search_stocks(keyword):
     """
     try:
         url = f"http://suggest3.sinajs.cn/suggest/type=&key={keyword}"
-        resp = requests.get(url, timeout=2.0)
+        resp = _SESSION.get(url, timeout=2.0)
         if resp.status_code == 200:
-            content = resp.text
+            content = _resp_text(resp, SINA_ENCODING)
             # var suggestdata_123="sh600519,gzmt,贵州茅台,11,1;sz000001,payh,平安银行,11,1";
             if '"' in content:
                 data_str = content.split('"')[1]
@@ -334,101 +628,120 @@ def search_stocks(keyword):
         print(f"Error searching stocks: {e}")
     return []
 
-def get_stock_realtime_detail(full_code):
+def _parse_sina_stock_detail(data_str, include_bid_ask=False):
+    """
+    Parse one Sina stock quote payload (the part between the quotes) into a detail dict.
+    Returns None when the payload is too short (unknown symbol, suspended, ...).
+    """
+    parts = data_str.split(',')
+    if len(parts) <= 30:
+        return None
+    
+    # Sina Stock Data Format:
+    # 0: name, 1: open, 2: pre_close, 3: price, 4: high, 5: low
+    # 8: vol (shares), 9: amount (yuan)
+    # 10-19: bid volume/price x5, 20-29: ask volume/price x5
+    # 30: date, 31: time
+    
+    price = float(parts[3])
+    pre_close = float(parts[2])
+    
+    # Calculate change
+    change = 0.0
+    pct_change = 0.0
+    if pre_close > 0:
+        change = price - pre_close
+        pct_change = (change / pre_close) * 100
+        
+    detail = {
+        'name': parts[0],
+        'price': price,
+        'change': change,
+        'pct_change': pct_change,
+        'open': float(parts[1]),
+        'pre_close': pre_close,
+        'high': float(parts[4]),
+        'low': float(parts[5]),
+        'volume': float(parts[8]), # Shares
+        'amount': float(parts[9]), # Yuan
+        'date': parts[30],
+        'time': parts[31]
+    }
+    if include_bid_ask:
+        # b1_v, b1_p ... b5_v, b5_p, a1_v, a1_p ... a5_v, a5_p
+        detail['bid_ask'] = {
+            f"{side}{lvl}_{kind}": float(parts[base + (lvl - 1) * 2 + k])
+            for side, base in (('b', 10), ('a', 20))
+            for lvl in range(1, 6)
+            for k, kind in enumerate(('v', 'p'))
+        }
+    return detail
+
+def get_stock_realtime_detail(full_code, include_bid_ask=False):
     """
     Get detailed real-time stock data from Sina.
     full_code: e.g. 'sh600519'
+    include_bid_ask: also parse the 5-level order book into 'bid_ask' (stock detail page only)
     """
     try:
-        url = f"http://hq.sinajs.cn/list={full_code}"
-        headers = {"Referer": "https://finance.sina.com.cn/"}
-        resp = requests.get(url, headers=headers, timeout=2.0)
+        url = SINA_HQ_URL.format(full_code)
+        resp = _SESSION.get(url, headers=SINA_HEADERS, timeout=2.0)
         
         if resp.status_code == 200:
-            content = resp.text
+            content = _resp_text(resp, SINA_ENCODING)
             if "=" in content:
                 data_str = content.split('=')[1].strip().strip('";')
-                parts = data_str.split(',')
-                if len(parts) > 30:
-                    # Sina Stock Data Format:
-                    # 0: name, 1: open, 2: pre_close, 3: price, 4: high, 5: low
-                    # 8: vol (shares), 9: amount (yuan)
-                    # 30: date, 31: time
-                    
-                    price = float(parts[3])
-                    pre_close = float(parts[2])
-                    
-                    # Calculate change
-                    change = 0.0
-                    pct_change = 0.0
-                    if pre_close > 0:
-                        change = price - pre_close
-                        pct_change = (change / pre_close) * 100
-                        
-                    return {
-                        'name': parts[0],
-                        'price': price,
-                        'change': change,
-                        'pct_change': pct_change,
-                        'open': float(parts[1]),
-                        'pre_close': pre_close,
-                        'high': float(parts[4]),
-                        'low': float(parts[5]),
-                        'volume': float(parts[8]), # Shares
-                        'amount': float(parts[9]), # Yuan
-                        'date': parts[30],
-                        'time': parts[31],
-                        'bid_ask': {
-                            'b1_v': float(parts[10]), 'b1_p': float(parts[11]),
-                            'b2_v': float(parts[12]), 'b2_p': float(parts[13]),
-                            'b3_v': float(parts[14]), 'b3_p': float(parts[15]),
-                            'b4_v': float(parts[16]), 'b4_p': float(parts[17]),
-                            'b5_v': float(parts[18]), 'b5_p': float(parts[19]),
-                            'a1_v': float(parts[20]), 'a1_p': float(parts[21]),
-                            'a2_v': float(parts[22]), 'a2_p': float(parts[23]),
-                            'a3_v': float(parts[24]), 'a3_p': float(parts[25]),
-                            'a4_v': float(parts[26]), 'a4_p': float(parts[27]),
-                            'a5_v': float(parts[28]), 'a5_p': float(parts[29]),
-                        }
-                    }
+                return _parse_sina_stock_detail(data_str, include_bid_ask)
     except Exception as e:
         print(f"Error fetching stock detail for {full_code}: {e}")
     return None
 
+def get_batch_stock_details(full_codes):
+    """
+    Real-time details for several stocks/indices with one Sina list= request per SINA_BATCH_SIZE codes
+    (dashboard watchlist). Returns {full_code: detail}; codes that failed are missing.
+    """
+    results = {}
+    for i in range(0, len(full_codes), SINA_BATCH_SIZE):
+        batch = full_codes[i:i + SINA_BATCH_SIZE]
+        try:
+            url = SINA_HQ_URL.format(','.join(batch))
+            resp = _SESSION.get(url, headers=SINA_HEADERS, timeout=2.0)
+            if resp.status_code != 200:
+                continue
+            
+            for m in _HQ_RE.finditer(_resp_text(resp, SINA_ENCODING)):
+                try:
+                    detail = _parse_sina_stock_detail(m.group(2))
+                    if detail:
+                        results[m.group(1)] = detail
+                except (ValueError, IndexError):
+                    pass
+        except Exception as e:
+            print(f"Error fetching stock details for {batch}: {e}")
+    return results
+
 def get_stock_trends(symbol, market):
     """
     Get minute-level trends (Intraday) from EastMoney.
     market: 'sh' or 'sz'
+    Returns {'pre_close': float, 'trends': DataFrame[time, price]}
     """
     try:
         secid = f"1.{symbol}" if market == 'sh' else f"0.{symbol}"
-        url = f"http://push2.eastmoney.com/api/qt/stock/trends2/get?secid={secid}&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f53&iscr=0"
-        # f51: time, f53: price
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Referer": "http://quote.eastmoney.com/"
-        }
-        
-        resp = requests.get(url, headers=headers, timeout=2.0)
+        resp = _SESSION.get(EM_TRENDS_URL.format(secid=secid), headers=EM_HEADERS, timeout=2.0)
         if resp.status_code == 200:
-            data = resp.json()
+            data = _json_loads(resp.content)
             if data and data.get('data') and data['data'].get('trends'):
                 trends = data['data']['trends']
-                # Format: "2023-10-27 09:30,123.45"
-                processed_data = []
+                # Format: "2023-10-27 09:30,123.45" -> parse all rows in one read_csv call
                 pre_close = data['data']['preClose']
-                
-                for t in trends:
-                    parts = t.split(',')
-                    processed_data.append({
-                        'time': parts[0],
-                        'price': float(parts[1])
-                    })
+                df = pd.read_csv(io.StringIO('\n'.join(trends)), header=None,
+                                 names=['time', 'price'], dtype={'time': str, 'price': float})
                 
                 return {
                     'pre_close': pre_close,
-                    'trends': processed_data
+                    'trends': df
                 }
     except Exception as e:
         print(f"Error fetching trends for {symbol}: {e}")
@@ -438,36 +751,20 @@ def get_stock_kline(symbol, market, period='101'):
     """
     Get K-line data from EastMoney.
     period: '101' (Day), '102' (Week), '103' (Month)
+    Returns a DataFrame [date, open, close, high, low, volume, amount]
     """
     try:
         secid = f"1.{symbol}" if market == 'sh' else f"0.{symbol}"
-        # f51: date, f52: open, f53: close, f54: high, f55: low, f56: vol, f57: amount, f58: amplitude
-        url = f"http://push2his.eastmoney.com/api/qt/stock/kline/get?secid={secid}&fields1=f1,f2,f3,f4,f5,f6,f7,f8&fields2=f51,f52,f53,f54,f55,f56,f57,f58&klt={period}&fqt=1&end=20500101&lmt=120"
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Referer": "http://quote.eastmoney.com/"
-        }
-        
-        resp = requests.get(url, headers=headers, timeout=2.0)
+        resp = _SESSION.get(EM_KLINE_URL.format(secid=secid, period=period), headers=EM_HEADERS, timeout=2.0)
         if resp.status_code == 200:
-            data = resp.json()
+            data = _json_loads(resp.content)
             if data and data.get('data') and data['data'].get('klines'):
                 klines = data['data']['klines']
-                processed_data = []
-                
-                for k in klines:
-                    parts = k.split(',')
-                    processed_data.append({
-                        'date': parts[0],
-                        'open': float(parts[1]),
-                        'close': float(parts[2]),
-                        'high': float(parts[3]),
-                        'low': float(parts[4]),
-                        'volume': float(parts[5]),
-                        'amount': float(parts[6])
-                    })
-                return processed_data
+                # Format: "date,open,close,high,low,vol,amount,amplitude" -> one read_csv call
+                return pd.read_csv(io.StringIO('\n'.join(klines)), header=None, usecols=range(7),
+                                   names=['date', 'open', 'close', 'high', 'low', 'volume', 'amount'],
+                                   dtype={'date': str, 'open': float, 'close': float, 'high': float,
+                                          'low': float, 'volume': float, 'amount': float})
     except Exception as e:
         print(f"Error fetching kline for {symbol}: {e}")
     return None
@@ -481,17 +778,12 @@ def _fetch_financial_news():
         # 1. Try EastMoney first (Has direct URLs)
         df = safe_ak_call(ak.stock_info_global_em)
         if not df.empty:
-            news_list = []
-            for _, row in df.head(15).iterrows():
-                title = row['标题']
-                url = row['链接']
-                news_list.append({
-                    'title': title,
-                    'time': str(row['发布时间']),
-                    'tag': '东方财富',
-                    'url': url
-                })
-            return news_list
+            return [{
+                'title': r['标题'],
+                'time': str(r['发布时间']),
+                'tag': '东方财富',
+                'url': r['链接']
+            } for r in df.head(15).to_dict('records')]
             
     except Exception as e:
         print(f"Error fetching EastMoney news: {e}")
@@ -501,15 +793,14 @@ def _fetch_financial_news():
         df = safe_ak_call(ak.stock_info_global_cls)
         if not df.empty:
             news_list = []
-            for _, row in df.head(15).iterrows():
-                title = row['标题'] if row['标题'] else row['内容'][:60] + "..."
-                # Use a more direct search link for the news title
-                url = f"https://www.baidu.com/s?wd={title}"
+            for r in df.head(15).to_dict('records'):
+                title = r['标题'] or r['内容'][:60] + "..."
                 news_list.append({
                     'title': title,
-                    'time': str(row['发布时间']),
+                    'time': str(r['发布时间']),
                     'tag': '财联社',
-                    'url': url
+                    # Use a more direct search link for the news title
+                    'url': f"https://www.baidu.com/s?wd={title}"
                 })
             return news_list
     except Exception as e:
@@ -544,8 +835,8 @@ def get_fund_base_info(fund_code):
     """
     Fetch basic fund information using cached full list + detailed info.
     """
-    # 1. Basic Info from cached list
-    fund_name_df = _fetch_all_fund_names()
+    # 1. Basic Info from cached list (indexed by code)
+    fund_index = _fetch_fund_names_index()
     
     info = {
          'code': fund_code,
@@ -561,11 +852,9 @@ def get_fund_base_info(fund_code):
          'benchmark': '--'
      }
     
-    if not fund_name_df.empty:
-        fund_match = fund_name_df[fund_name_df['基金代码'] == fund_code]
-        if not fund_match.empty:
-            info['name'] = fund_match['基金简称'].iloc[0]
-            info['type'] = fund_match['基金类型'].iloc[0]
+    fund_match = fund_index.get(fund_code)
+    if fund_match:
+        info['name'], info['type'] = fund_match
 
     # 2. Detailed Info from Real API (XueQiu)
     details = _fetch_fund_details_xq(fund_code)
@@ -600,17 +889,13 @@ def search_funds(keyword):
         
     # 1. Exact Code Match
     if keyword.isdigit() and len(keyword) == 6:
-        match = fund_name_df[fund_name_df['基金代码'] == keyword]
-        if not match.empty:
-            return match.rename(columns={
-                '基金代码': 'code',
-                '基金简称': 'name',
-                '基金类型': 'type'
-            })[['code', 'name', 'type']]
+        fund_match = _fetch_fund_names_index().get(keyword)
+        if fund_match:
+            return pd.DataFrame([{'code': keyword, 'name': fund_match[0], 'type': fund_match[1]}])
 
     # 2. Fuzzy Name Match
-    # Filter by name contains keyword (case insensitive)
-    match = fund_name_df[fund_name_df['基金简称'].str.contains(keyword, na=False, case=False)]
+    # Filter by name contains keyword (case insensitive, plain substring - no regex compile)
+    match = fund_name_df[fund_name_df['_name_lower'].str.contains(keyword.lower(), na=False, regex=False)]
     
     if not match.empty:
         return match.rename(columns={
@@ -627,6 +912,15 @@ def get_fund_basic_info(fund_code):
     """
     return get_fund_base_info(fund_code)
 
+def _slice_by_date(df, start_ts, end_ts):
+    """
+    Rows of a history frame (sorted by 净值日期) within [start_ts, end_ts], via binary search.
+    """
+    dates = df['净值日期'].values
+    lo = dates.searchsorted(np.datetime64(start_ts, 'ns'), side='left')
+    hi = dates.searchsorted(np.datetime64(end_ts, 'ns'), side='right')
+    return df.iloc[lo:hi]
+
 def get_fund_nav_history(fund_code, start_date='2020-01-01', end_date=None):
     """
     Get historical NAV data.
@@ -635,72 +929,57 @@ def get_fund_nav_history(fund_code, start_date='2020-01-01', end_date=None):
     
     if df.empty:
         return pd.DataFrame()
-        
-    if not end_date:
-        end_date = datetime.datetime.now().strftime("%Y%m%d")
-    start_date = start_date.replace('-', '')
     
-    mask = (df['净值日期'] >= pd.to_datetime(start_date)) & (df['净值日期'] <= pd.to_datetime(end_date))
-    return df.loc[mask].sort_values('净值日期')
+    # Raw history is already sorted, so bounds are two binary searches instead of a full mask
+    start_ts = pd.Timestamp(start_date)
+    end_ts = pd.Timestamp(end_date) if end_date else pd.Timestamp.now().normalize()
+    return _slice_by_date(df, start_ts, end_ts)
+
+def get_fund_nav_array(fund_code, start_date='2020-01-01', end_date=None):
+    """
+    Historical NAVs as bare arrays: (dates datetime64[ns], navs float64), same window as get_fund_nav_history.
+    Read-only views into the cached history, so numeric callers skip the DataFrame slice and column lookups.
+    """
+    df = _fetch_fund_history_raw(fund_code)
+    
+    if df.empty:
+        return np.empty(0, dtype='datetime64[ns]'), np.empty(0, dtype=np.float64)
+    
+    start_ts = pd.Timestamp(start_date)
+    end_ts = pd.Timestamp(end_date) if end_date else pd.Timestamp.now().normalize()
+    dates = df['净值日期'].to_numpy()
+    lo = dates.searchsorted(np.datetime64(start_ts, 'ns'), side='left')
+    hi = dates.searchsorted(np.datetime64(end_ts, 'ns'), side='right')
+    dates = dates[lo:hi]
+    navs = df['单位净值'].to_numpy(np.float64)[lo:hi]
+    # Views share memory with the cached frame: make accidental in-place edits fail loudly
+    dates.flags.writeable = False
+    navs.flags.writeable = False
+    return dates, navs
 
 @st.cache_data(ttl=60) # Cache for 60 seconds
 def get_fund_intraday_trend(fund_code):
     """
     Fetch intraday estimation trend for a fund.
     Returns a DataFrame with columns ['时间', '估算值', '估算涨跌幅']
+    
+    akshare's fund_open_fund_info_em has no "单位净值估算走势" indicator: the call downloaded
+    and V8-evaluated the whole pingzhongdata script under ak_lock, then returned an empty
+    frame. No intraday estimate series is available from the current sources, so this
+    returns empty without touching the network (the fund page then shows the current
+    estimate; the holdings charts use the locally recorded ticks).
     """
-    try:
-        df = safe_ak_call(ak.fund_open_fund_info_em, symbol=fund_code, indicator="单位净值估算走势")
-        if not df.empty:
-            # The columns are usually ['时间', '估算值', '估算涨跌幅']
-            df['时间'] = pd.to_datetime(df['时间'])
-            return df
-    except Exception as e:
-        print(f"Error fetching intraday trend for {fund_code}: {e}")
     return pd.DataFrame()
 
 def get_batch_intraday_trends(fund_codes):
     """
-    Fetch intraday trends for multiple funds in parallel.
-    Returns a dict {code: {'values': [], 'pct': [], 'times': []}}
+    Intraday trends for multiple funds.
+    Returns a dict {code: {'values': [], 'pct': [], 'times': [], 'is_history': bool}}
+    
+    No intraday estimate source is available (see get_fund_intraday_trend), so every fund
+    gets an empty trend without submitting any work; the holdings charts use local ticks.
     """
-    results = {}
-    if not fund_codes:
-        return results
-
-    def _fetch_values(code):
-        df = get_fund_intraday_trend(code)
-        
-        # If empty, try to get historical trend (last available trading day)
-        is_history = False
-        if df.empty:
-            # We don't have a direct "historical intraday" API in AkShare for mutual funds,
-            # but EastMoney's trend API usually returns the LAST available session if it's currently night/weekend.
-            # If it's truly empty, it might be the very early morning gap.
-            pass 
-
-        if not df.empty:
-            # Check if the data is from today or previous days
-            last_time = df['时间'].iloc[-1]
-            if last_time.date() < datetime.datetime.now().date():
-                is_history = True
-                
-            # Ensure columns exist
-            if '估算值' in df.columns and '估算涨跌幅' in df.columns and '时间' in df.columns:
-                 return code, {
-                     'values': df['估算值'].tolist(),
-                     'pct': df['估算涨跌幅'].tolist(),
-                     'times': df['时间'].dt.strftime('%H:%M').tolist(),
-                     'is_history': is_history
-                 }
-        return code, {'values': [], 'pct': [], 'times': [], 'is_history': False}
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(_fetch_values, code) for code in fund_codes]
-        for future in concurrent.futures.as_completed(futures):
-            code, data = future.result()
-            results[code] = data
-    return results
+    return {code: {'values': [], 'pct': [], 'times': [], 'is_history': False} for code in fund_codes}
 
 def get_real_time_estimate(fund_code, pre_fetched_data=None):
     """
@@ -781,43 +1060,44 @@ def get_portfolio_history(holdings, days=30):
         return pd.DataFrame()
         
     end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(days=days + 10)
-    start_date_str = start_date.strftime('%Y-%m-%d')
+    cutoff = pd.to_datetime(end_date - datetime.timedelta(days=days))
+    cutoff64 = np.datetime64(cutoff, 'ns')
+    end64 = np.datetime64(pd.Timestamp(end_date.date()), 'ns')
     
-    # 1. Fetch all histories in parallel
+    # 1. Fetch all histories in parallel on the shared I/O pool
+    # Note: Streamlit cache is thread-safe
     codes = [item['fund_code'] for item in holdings]
+    raw_frames = _IO_POOL.map(_fetch_fund_history_raw, codes)
     
-    # We use a ThreadPoolExecutor to fetch data in parallel
-    # Note: Streamlit cache is thread-safe
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        # Pre-fetch / Ensure cache is populated
-        list(executor.map(_fetch_fund_history_raw, codes))
+    # 2. Per-fund (dates, NAV * share) arrays, already truncated to the window.
+    # Each fund keeps one extra row at/before the cutoff so the forward-fill below has a seed value.
+    fund_arrays = []
+    for item, raw in zip(holdings, raw_frames):
+        if raw.empty:
+            continue
+        dates = raw['净值日期'].values
+        lo = max(dates.searchsorted(cutoff64, side='left') - 1, 0)
+        hi = dates.searchsorted(end64, side='right')
+        if hi > lo:
+            fund_arrays.append((dates[lo:hi], raw['单位净值'].values[lo:hi] * item['share']))
     
-    # 2. Process (now hitting cache)
-    total_value_series = None
+    if not fund_arrays:
+        return pd.Series()
     
-    for item in holdings:
-        code = item['fund_code']
-        share = item['share']
-        
-        # This will now be instant (cached)
-        df = get_fund_nav_history(code, start_date=start_date_str)
-        
-        if not df.empty:
-            df = df.set_index('净值日期')
-            val_series = df['单位净值'] * share
-            
-            if total_value_series is None:
-                total_value_series = val_series
-            else:
-                total_value_series = total_value_series.add(val_series, fill_value=0)
+    # 3. One shared grid (union of NAV dates in the window) and a preallocated accumulator.
+    # searchsorted(side='right') - 1 is the forward-fill: each grid date takes the fund's last NAV on or before it.
+    grid = np.unique(np.concatenate([dates for dates, _ in fund_arrays]))
+    grid = grid[grid >= cutoff64]
+    total = np.zeros(len(grid), dtype=np.float64)
+    has_value = np.zeros(len(grid), dtype=bool)
+    for dates, values in fund_arrays:
+        pos = dates.searchsorted(grid, side='right') - 1
+        valid = pos >= 0
+        # Funds without a NAV yet on a date contribute nothing; dates with no fund at all are dropped
+        total[valid] += values[pos[valid]]
+        has_value |= valid
     
-    if total_value_series is not None:
-        total_value_series = total_value_series.sort_index().dropna()
-        mask = total_value_series.index >= pd.to_datetime(end_date - datetime.timedelta(days=days))
-        return total_value_series[mask]
-        
-    return pd.Series()
+    return pd.Series(total[has_value], index=pd.DatetimeIndex(grid[has_value]))
 
 def prefetch_data(fund_codes):
     """
@@ -827,12 +1107,10 @@ def prefetch_data(fund_codes):
     if not fund_codes:
         return
         
-    # We use a ThreadPoolExecutor to fetch data in parallel
+    # We use the shared I/O pool to fetch data in parallel
     # NOTE: We NO LONGER call _fetch_realtime_estimations (bulk) here
     # because it is too slow. We rely on on-demand fast single fetches.
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-        # Submit history fetch tasks for all funds
-        for code in fund_codes:
-            executor.submit(_fetch_fund_history_raw, code)
+    # Fetch all (deduplicated) histories and wait for them to land in the cache
+    list(_IO_POOL.map(_fetch_fund_history_raw, dict.fromkeys(fund_codes)))
 
@@ -1,185 +1,364 @@
 import sqlite3
 import pandas as pd
-import os
-from datetime import datetime
+import queue
+import calendar
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from datetime import datetime, timedelta
 
 DB_FILE = 'fund_data.db'
 
+# Applied to every pooled connection when it is opened
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers don't block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",    # safe with WAL, one fsync per checkpoint instead of per commit
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",     # ~64MB page cache
+    "PRAGMA busy_timeout=5000",     # another process holding the write lock: wait, don't fail with SQLITE_BUSY
+    "PRAGMA mmap_size=268435456",   # read pages through a 256MB memory map instead of read() calls
+)
+
+# Bumped whenever init_db gains a migration step; stored in PRAGMA user_version.
+# 1: base tables, 2: investment_plans.execution_day, 3: INTEGER intraday_ticks.record_time
+SCHEMA_VERSION = 3
+
+# Larger pages -> shallower B-trees for the tick table's range scans
+PAGE_SIZE = 8192
+
+
+# Idle read connections kept around for reuse
+READ_POOL_SIZE = 8
+
+_read_pool = queue.Queue(maxsize=READ_POOL_SIZE)
+_write_conn = None
+_WRITE_LOCK = threading.Lock()
+
 def init_db():
-    """Initialize the database with necessary tables."""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # Holdings table: Stores user's fund holdings
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS holdings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fund_code TEXT NOT NULL,
-            fund_name TEXT,
-            share REAL NOT NULL,
-            cost_price REAL NOT NULL,
-            purchase_date TEXT
-        )
-    ''')
+    """Initialize the database with necessary tables (no-op once the file is at SCHEMA_VERSION)."""
+    # Schema setup goes through the writer lock so it can't interleave with other writes
+    with write_conn() as conn:
+        c = conn.cursor()
+        
+        version = c.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        
+        # page_size only applies to a new or vacuumed file, and not while in WAL mode.
+        # Only done when it differs, i.e. once per database file.
+        if c.execute('PRAGMA page_size').fetchone()[0] != PAGE_SIZE:
+            c.execute('PRAGMA journal_mode=DELETE')
+            c.execute(f'PRAGMA page_size={PAGE_SIZE}')
+            c.execute('VACUUM')
+            c.execute('PRAGMA journal_mode=WAL')
     
-    # Investment Plans table: Stores auto-investment (定投) plans
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS investment_plans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fund_code TEXT NOT NULL,
-            fund_name TEXT,
-            amount REAL NOT NULL,
-            frequency TEXT NOT NULL,
-            execution_day TEXT,
-            start_date TEXT,
-            status TEXT DEFAULT 'active'
-        )
-    ''')
+        # Holdings table: Stores user's fund holdings
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS holdings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code TEXT NOT NULL,
+                fund_name TEXT,
+                share REAL NOT NULL,
+                cost_price REAL NOT NULL,
+                purchase_date TEXT
+            )
+        ''')
     
-    # Attempt to add execution_day column if it doesn't exist (Migration for existing DB)
-    try:
-        c.execute('ALTER TABLE investment_plans ADD COLUMN execution_day TEXT')
-    except sqlite3.OperationalError:
-        pass # Column likely already exists
-
-    # Knowledge/Favorites table
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS favorites (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT,
-            url TEXT,
-            category TEXT,
-            added_date TEXT
-        )
-    ''')
+        # Investment Plans table: Stores auto-investment (定投) plans
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS investment_plans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code TEXT NOT NULL,
+                fund_name TEXT,
+                amount REAL NOT NULL,
+                frequency TEXT NOT NULL,
+                execution_day TEXT,
+                start_date TEXT,
+                status TEXT DEFAULT 'active'
+            )
+        ''')
     
-    # Intraday Ticks table: Stores real-time ticks for charts
-    # We store timestamp as TEXT (ISO format)
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS intraday_ticks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fund_code TEXT NOT NULL,
-            record_time TEXT NOT NULL,
-            pct REAL NOT NULL,
-            price REAL,
-            UNIQUE(fund_code, record_time)
-        )
-    ''')
+        # Attempt to add execution_day column if it doesn't exist (Migration for existing DB)
+        if version < 2:
+            try:
+                c.execute('ALTER TABLE investment_plans ADD COLUMN execution_day TEXT')
+            except sqlite3.OperationalError:
+                pass # Column likely already exists
+
+        # Knowledge/Favorites table
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS favorites (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT,
+                url TEXT,
+                category TEXT,
+                added_date TEXT
+            )
+        ''')
     
-    # Settings table: Stores global configuration like API keys
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT
-        )
-    ''')
+        # Intraday Ticks table: Stores real-time ticks for charts
+        # record_time is the market wall-clock time stored as INTEGER epoch seconds
+        # (naive time treated as UTC, see _to_epoch) -> 8-byte keys, integer compares
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS intraday_ticks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fund_code TEXT NOT NULL,
+                record_time INTEGER NOT NULL,
+                pct REAL NOT NULL,
+                price REAL,
+                UNIQUE(fund_code, record_time)
+            )
+        ''')
+        
+        # Migration: older databases stored record_time as ISO TEXT -> rebuild with epoch integers
+        tick_cols = {row[1]: row[2] for row in c.execute('PRAGMA table_info(intraday_ticks)')}
+        if version < 3 and tick_cols.get('record_time', '').upper() == 'TEXT':
+            c.execute('BEGIN IMMEDIATE')
+            try:
+                c.execute('DROP INDEX IF EXISTS idx_ticks_code_time')
+                c.execute('ALTER TABLE intraday_ticks RENAME TO intraday_ticks_old')
+                c.execute('''
+                    CREATE TABLE intraday_ticks (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        fund_code TEXT NOT NULL,
+                        record_time INTEGER NOT NULL,
+                        pct REAL NOT NULL,
+                        price REAL,
+                        UNIQUE(fund_code, record_time)
+                    )
+                ''')
+                c.execute('''
+                    INSERT OR IGNORE INTO intraday_ticks (fund_code, record_time, pct, price)
+                    SELECT fund_code, CAST(strftime('%s', record_time) AS INTEGER), pct, price
+                    FROM intraday_ticks_old
+                    WHERE strftime('%s', record_time) IS NOT NULL
+                ''')
+                c.execute('DROP TABLE intraday_ticks_old')
+                c.execute('COMMIT')
+            except Exception:
+                c.execute('ROLLBACK')
+                raise
     
-    # User Indices table: Stores user-selected indices/stocks for the dashboard
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS user_indices (
-            symbol TEXT PRIMARY KEY,
-            name TEXT,
-            market TEXT
-        )
-    ''')
+        # Covering index for the per-fund "today's ticks" range query (served from the index alone)
+        c.execute('CREATE INDEX IF NOT EXISTS idx_ticks_code_time ON intraday_ticks (fund_code, record_time, pct, price)')
+        
+        # Settings table: Stores global configuration like API keys
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
     
-    # Search History table: Stores recent search keywords
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS search_history (
-            keyword TEXT PRIMARY KEY,
-            timestamp TEXT
-        )
-    ''')
+        # User Indices table: Stores user-selected indices/stocks for the dashboard
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS user_indices (
+                symbol TEXT PRIMARY KEY,
+                name TEXT,
+                market TEXT
+            )
+        ''')
     
-    # Asset History table: Stores daily snapshots of total portfolio value
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS asset_history (
-            date TEXT PRIMARY KEY,
-            total_market_value REAL,
-            total_cost REAL,
-            day_profit REAL
-        )
-    ''')
+        # Search History table: Stores recent search keywords
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS search_history (
+                keyword TEXT PRIMARY KEY,
+                timestamp TEXT
+            )
+        ''')
     
-    conn.commit()
-    conn.close()
+        # Asset History table: Stores daily snapshots of total portfolio value
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS asset_history (
+                date TEXT PRIMARY KEY,
+                total_market_value REAL,
+                total_cost REAL,
+                day_profit REAL
+            )
+        ''')
+        
+        c.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+def _open_connection():
+    """Open a connection usable from any thread, in autocommit mode, with our PRAGMAs applied."""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, isolation_level=None)
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+@contextmanager
+def read_conn():
+    """
+    Borrow a read connection from the pool (opened on demand).
+    Connections beyond READ_POOL_SIZE are closed instead of returned.
+    """
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+    try:
+        yield conn
+    finally:
+        try:
+            _read_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@contextmanager
+def write_conn(transaction=False):
+    """
+    Use the single long-lived writer connection. All writers (including init_db) are
+    serialized by _WRITE_LOCK so they queue here instead of contending inside SQLite
+    and surfacing SQLITE_BUSY.
+    transaction=True wraps the block in BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error):
+    the connection is in autocommit mode, so multi-statement writes need it to commit once,
+    and IMMEDIATE takes the write lock up front instead of upgrading a deferred read lock.
+    """
+    global _write_conn
+    with _WRITE_LOCK:
+        if _write_conn is None:
+            _write_conn = _open_connection()
+        if not transaction:
+            yield _write_conn
+            return
+        _write_conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield _write_conn
+        except BaseException:
+            _write_conn.execute('ROLLBACK')
+            raise
+        _write_conn.execute('COMMIT')
+
+def _to_epoch(value):
+    """
+    'YYYY-MM-DD HH:MM:SS' / datetime -> integer seconds, treating the naive wall-clock time as UTC
+    so the stored value round-trips to the same market time regardless of the server's timezone.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return calendar.timegm(value.timetuple())
+
+# --- In-process table cache ---
+# holdings / investment_plans / user_indices are read on every refresh but only change
+# through the write functions below, which invalidate the cached frame after committing.
+_table_cache = {}
+_CACHE_LOCK = threading.Lock()
 
-def get_connection():
-    return sqlite3.connect(DB_FILE)
+def _cached_table(table):
+    """Return a copy of the full table as a DataFrame, loading it once until invalidated."""
+    with _CACHE_LOCK:
+        df = _table_cache.get(table)
+        if df is None:
+            # Load under the lock so a concurrent invalidation can't be overwritten by stale data
+            with read_conn() as conn:
+                df = pd.read_sql(f'SELECT * FROM {table}', conn)
+            _table_cache[table] = df
+    return df.copy()
+
+def _invalidate_table(table):
+    with _CACHE_LOCK:
+        _table_cache.pop(table, None)
 
 # --- Settings Operations ---
+@lru_cache(maxsize=64)
+def _get_setting_row(key):
+    # Settings change rarely (API key, model name); cached until save_setting clears it
+    with read_conn() as conn:
+        return conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+
 def get_setting(key, default=None):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT value FROM settings WHERE key = ?', (key,))
-    row = c.fetchone()
-    conn.close()
+    row = _get_setting_row(key)
+    # Check the row, not the value, so a stored empty string isn't replaced by the default
     return row[0] if row else default
 
 def save_setting(key, value):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, value))
+    _get_setting_row.cache_clear()
 
 # --- User Indices Operations ---
 def get_user_indices():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM user_indices", conn)
-    conn.close()
-    return df
+    """Pinned dashboard symbols as a list of dicts (symbol, name, market) - a handful of rows, no DataFrame needed."""
+    with _CACHE_LOCK:
+        rows = _table_cache.get('user_indices')
+        if rows is None:
+            with read_conn() as conn:
+                rows = conn.execute('SELECT symbol, name, market FROM user_indices').fetchall()
+            _table_cache['user_indices'] = rows
+    return [{'symbol': symbol, 'name': name, 'market': market} for symbol, name, market in rows]
 
 def add_user_index(symbol, name, market=''):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT OR REPLACE INTO user_indices (symbol, name, market) VALUES (?, ?, ?)', (symbol, name, market))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('INSERT OR REPLACE INTO user_indices (symbol, name, market) VALUES (?, ?, ?)', (symbol, name, market))
+    _invalidate_table('user_indices')
 
 def remove_user_index(symbol):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('DELETE FROM user_indices WHERE symbol = ?', (symbol,))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('DELETE FROM user_indices WHERE symbol = ?', (symbol,))
+    _invalidate_table('user_indices')
 
 # --- Intraday Ticks Operations ---
 def save_tick_batch(ticks_data):
     """
-    Save a batch of tick data.
+    Save a batch of tick data (all funds of one refresh) in a single transaction.
     ticks_data: list of tuples (fund_code, record_time, pct, price)
+    record_time: 'YYYY-MM-DD HH:MM:SS' string, datetime or epoch seconds
     """
     if not ticks_data:
         return
+    rows = []
+    for code, ts, pct, price in ticks_data:
+        try:
+            rows.append((code, _to_epoch(ts), pct, price))
+        except (ValueError, TypeError):
+            continue # Placeholder dates from failed estimates (e.g. '-- 数据暂不可用') aren't real ticks
+    if not rows:
+        return
         
-    conn = get_connection()
-    c = conn.cursor()
-    # Use INSERT OR IGNORE to avoid duplicates if we fetch same second twice
-    c.executemany('''
-        INSERT OR IGNORE INTO intraday_ticks (fund_code, record_time, pct, price)
-        VALUES (?, ?, ?, ?)
-    ''', ticks_data)
-    conn.commit()
-    conn.close()
+    # Explicit transaction: in autocommit mode executemany would commit every row
+    with write_conn(transaction=True) as conn:
+        # Use INSERT OR IGNORE to avoid duplicates if we fetch same second twice
+        conn.executemany('''
+            INSERT OR IGNORE INTO intraday_ticks (fund_code, record_time, pct, price)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
 
 def get_today_ticks(fund_code):
     """
     Get ticks for a specific fund for the current day.
     Returns DataFrame with columns ['record_time', 'pct', 'price']
     """
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    conn = get_connection()
-    # Filter by time starting with today's date
-    query = f"SELECT record_time, pct, price FROM intraday_ticks WHERE fund_code = ? AND record_time LIKE '{today_str}%' ORDER BY record_time ASC"
-    df = pd.read_sql(query, conn, params=(fund_code,))
-    conn.close()
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    start, end = _to_epoch(today), _to_epoch(today + timedelta(days=1))
+    # Half-open integer range on record_time -> index range scan
+    query = "SELECT record_time, pct, price FROM intraday_ticks WHERE fund_code = ? AND record_time >= ? AND record_time < ? ORDER BY record_time ASC"
+    with read_conn() as conn:
+        df = pd.read_sql(query, conn, params=(fund_code, start, end))
+    df['record_time'] = pd.to_datetime(df['record_time'], unit='s')
     return df
 
+def get_today_ticks_multi(fund_codes):
+    """
+    Today's ticks for several funds in one query.
+    Returns {fund_code: DataFrame(record_time, pct, price)}; funds without ticks are absent.
+    """
+    codes = list(dict.fromkeys(fund_codes))
+    if not codes:
+        return {}
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    start, end = _to_epoch(today), _to_epoch(today + timedelta(days=1))
+    placeholders = ','.join('?' * len(codes))
+    query = f"SELECT fund_code, record_time, pct, price FROM intraday_ticks WHERE fund_code IN ({placeholders}) AND record_time >= ? AND record_time < ? ORDER BY fund_code, record_time"
+    with read_conn() as conn:
+        df = pd.read_sql(query, conn, params=(*codes, start, end))
+    df['record_time'] = pd.to_datetime(df['record_time'], unit='s')
+    return {code: group.drop(columns='fund_code').reset_index(drop=True)
+            for code, group in df.groupby('fund_code', sort=False)}
+
 def cleanup_old_ticks(days_to_keep=2):
     """Delete ticks older than N days to save space."""
-    conn = get_connection()
-    c = conn.cursor()
     # Simple date string comparison works for ISO format
     # But calculating the cutoff date string is safer
     # For simplicity, we just delete anything not from today? 
@@ -189,139 +368,119 @@ def cleanup_old_ticks(days_to_keep=2):
     # If they open tomorrow morning before market, they might want to see yesterday's.
     # Let's keep last 3 days.
     
-    # actually, SQLite date modifier: date('now', '-2 days')
-    c.execute("DELETE FROM intraday_ticks WHERE record_time < date('now', '-3 days')")
-    conn.commit()
-    conn.close()
+    # Cutoff: midnight 3 days ago, in the same epoch encoding as record_time
+    cutoff = datetime.combine(datetime.now().date() - timedelta(days=3), datetime.min.time())
+    with write_conn() as conn:
+        conn.execute("DELETE FROM intraday_ticks WHERE record_time < ?", (_to_epoch(cutoff),))
 
 # --- Holdings Operations ---
+def add_holdings_bulk(rows):
+    """
+    Insert many holdings in one transaction.
+    rows: list of tuples (fund_code, fund_name, share, cost_price, purchase_date); a missing
+    purchase_date (None/'') becomes today, formatted once for the whole batch.
+    """
+    if not rows:
+        return
+    today = datetime.now().strftime("%Y-%m-%d")
+    rows = [(code, name, share, cost, purchase_date or today) for code, name, share, cost, purchase_date in rows]
+    with write_conn(transaction=True) as conn:
+        conn.executemany('INSERT INTO holdings (fund_code, fund_name, share, cost_price, purchase_date) VALUES (?, ?, ?, ?, ?)', rows)
+    _invalidate_table('holdings')
+
 def add_holding(fund_code, fund_name, share, cost_price, purchase_date=None):
-    if not purchase_date:
-        purchase_date = datetime.now().strftime("%Y-%m-%d")
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO holdings (fund_code, fund_name, share, cost_price, purchase_date) VALUES (?, ?, ?, ?, ?)',
-              (fund_code, fund_name, share, cost_price, purchase_date))
-    conn.commit()
-    conn.close()
+    add_holdings_bulk([(fund_code, fund_name, share, cost_price, purchase_date)])
 
 def get_holdings():
-    conn = get_connection()
-    df = pd.read_sql('SELECT * FROM holdings', conn)
-    conn.close()
-    return df
+    return _cached_table('holdings')
 
 def delete_holding(holding_id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('DELETE FROM holdings WHERE id = ?', (holding_id,))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('DELETE FROM holdings WHERE id = ?', (holding_id,))
+    _invalidate_table('holdings')
 
 def update_holding(holding_id, share, cost_price):
     """Update share and cost price for an existing holding."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('UPDATE holdings SET share = ?, cost_price = ? WHERE id = ?',
-              (share, cost_price, holding_id))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('UPDATE holdings SET share = ?, cost_price = ? WHERE id = ?',
+                     (share, cost_price, holding_id))
+    _invalidate_table('holdings')
 
 # --- Investment Plan Operations ---
 def add_plan(fund_code, fund_name, amount, frequency, execution_day, start_date):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('INSERT INTO investment_plans (fund_code, fund_name, amount, frequency, execution_day, start_date) VALUES (?, ?, ?, ?, ?, ?)',
-              (fund_code, fund_name, amount, frequency, execution_day, start_date))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('INSERT INTO investment_plans (fund_code, fund_name, amount, frequency, execution_day, start_date) VALUES (?, ?, ?, ?, ?, ?)',
+                     (fund_code, fund_name, amount, frequency, execution_day, start_date))
+    _invalidate_table('investment_plans')
 
 def get_plans():
-    conn = get_connection()
-    df = pd.read_sql('SELECT * FROM investment_plans', conn)
-    conn.close()
-    return df
+    return _cached_table('investment_plans')
 
 def delete_plan(plan_id):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('DELETE FROM investment_plans WHERE id = ?', (plan_id,))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('DELETE FROM investment_plans WHERE id = ?', (plan_id,))
+    _invalidate_table('investment_plans')
+
+def delete_plans(plan_ids):
+    """Delete several plans in a single transaction."""
+    if not plan_ids:
+        return
+    with write_conn(transaction=True) as conn:
+        conn.executemany('DELETE FROM investment_plans WHERE id = ?', [(int(pid),) for pid in plan_ids])
+    _invalidate_table('investment_plans')
 
 def update_plan_status(plan_id, status):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('UPDATE investment_plans SET status = ? WHERE id = ?', (status, plan_id))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('UPDATE investment_plans SET status = ? WHERE id = ?', (status, plan_id))
+    _invalidate_table('investment_plans')
 
 # --- Search History Operations ---
 def add_search_history(keyword):
     """Add a search keyword to history. Keeps only top 10."""
     if not keyword:
         return
-    conn = get_connection()
-    c = conn.cursor()
     ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
-    # Insert or Replace to update timestamp if exists
-    c.execute('INSERT OR REPLACE INTO search_history (keyword, timestamp) VALUES (?, ?)', (keyword, ts))
-    
-    # Check count and delete old entries if > 10
-    c.execute("SELECT count(*) FROM search_history")
-    count = c.fetchone()[0]
-    
-    if count > 10:
-        c.execute('''
-            DELETE FROM search_history 
-            WHERE keyword NOT IN (
-                SELECT keyword FROM search_history ORDER BY timestamp DESC LIMIT 10
+    # One transaction for both statements (single commit)
+    with write_conn(transaction=True) as conn:
+        # Insert or Replace to update timestamp if exists
+        conn.execute('INSERT OR REPLACE INTO search_history (keyword, timestamp) VALUES (?, ?)', (keyword, ts))
+        
+        # Drop everything older than the 10th most recent entry.
+        # With fewer than 10 rows the subquery is NULL and nothing is deleted.
+        conn.execute('''
+            DELETE FROM search_history
+            WHERE timestamp < (
+                SELECT timestamp FROM search_history ORDER BY timestamp DESC LIMIT 1 OFFSET 9
             )
         ''')
-        
-    conn.commit()
-    conn.close()
 
 def get_search_history():
     """Get top 10 recent search keywords."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT keyword FROM search_history ORDER BY timestamp DESC LIMIT 10")
-    rows = c.fetchall()
-    conn.close()
+    with read_conn() as conn:
+        rows = conn.execute("SELECT keyword FROM search_history ORDER BY timestamp DESC LIMIT 10").fetchall()
     return [r[0] for r in rows]
 
 def clear_search_history():
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM search_history")
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute("DELETE FROM search_history")
 
 # --- Asset History Operations ---
 def save_asset_snapshot(date_str, total_market_value, total_cost, day_profit):
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('''
-        INSERT OR REPLACE INTO asset_history (date, total_market_value, total_cost, day_profit)
-        VALUES (?, ?, ?, ?)
-    ''', (date_str, total_market_value, total_cost, day_profit))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO asset_history (date, total_market_value, total_cost, day_profit)
+            VALUES (?, ?, ?, ?)
+        ''', (date_str, total_market_value, total_cost, day_profit))
 
 def get_asset_history():
-    conn = get_connection()
-    try:
-        df = pd.read_sql_query("SELECT * FROM asset_history ORDER BY date ASC", conn)
-    except:
-        df = pd.DataFrame()
-    conn.close()
-    return df
+    """Daily snapshots indexed by a DatetimeIndex on `date` (ORDER BY rides the primary key, no sort step)."""
+    with read_conn() as conn:
+        try:
+            return pd.read_sql_query("SELECT * FROM asset_history ORDER BY date ASC", conn,
+                                     parse_dates={'date': '%Y-%m-%d'}, index_col='date')
+        except (sqlite3.DatabaseError, pd.errors.DatabaseError):
+            return pd.DataFrame()
 
-# Initialize DB on module load if not exists
-if not os.path.exists(DB_FILE):
-    init_db()
-else:
-    # Check if tables exist to avoid errors if file exists but empty
-    init_db()
+# Initialize DB on module load (cheap user_version check once the schema is current)
+init_db()
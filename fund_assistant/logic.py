@@ -1,9 +1,17 @@
 import pandas as pd
 import numpy as np
 import datetime
+import time
 import os
 import sys
-from data_api import get_fund_nav_history
+import json
+import copy
+import bisect
+import re
+import threading
+from functools import lru_cache
+import data_api
+from data_api import get_fund_nav_history, get_fund_nav_array
 
 def ensure_dependencies():
     """
@@ -28,133 +36,231 @@ def ensure_dependencies():
                     continue
     return False
 
-# Try to load dependencies at module level
+# Try to load dependencies at module level, once; the AI functions only check the result
 ensure_dependencies()
+try:
+    import openai as _OPENAI
+    _OPENAI_ERR = None
+except ImportError as e:
+    _OPENAI = None
+    _OPENAI_ERR = e
 
-def analyze_fund_with_ai(fund_code, api_key, endpoint_id, fund_name=""):
+def _openai_missing_msg(title):
+    """Troubleshooting message shown in place of an AI report when `openai` failed to import."""
+    venv_path = os.path.join(os.path.dirname(__file__), "..", ".venv")
+    exists = "存在" if os.path.exists(venv_path) else "不存在"
+    return (
+        f"❌ **{title}**\n\n"
+        f"原因: 找不到 `openai` 库 ({str(_OPENAI_ERR)})\n\n"
+        f"**排查信息**:\n"
+        f"- 当前 Python: `{sys.executable}`\n"
+        f"- 虚拟环境 ({venv_path}): **{exists}**\n\n"
+        f"**解决方法**:\n"
+        f"1. 请确保已安装依赖：`pip install openai` 或运行目录下的 `run.bat`。\n"
+        f"2. 如果刚安装完，请**彻底关闭并重启** Streamlit 命令行窗口。"
+    )
+
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+# Single-fund analysis prompt, filled with str.format_map per call
+_FUND_PROMPT = """
+你是一位专业的基金分析师。请针对以下基金进行深度诊断和投资建议。
+
+基金名称：{fund_name}
+基金代码：{fund_code}
+
+近一年表现指标：
+- 累计收益率：{return_1y}
+- 最大回撤：{max_drawdown}
+- 夏普比率：{sharpe}
+- 综合评分：{score} / 5.0
+- 系统初步结论：{conclusion}
+
+请从以下几个维度进行专业分析：
+1. **业绩表现分析**：评价该基金在同类产品中的收益与风险控制能力。
+2. **风险评估**：分析其波动性和最大回撤背后的潜在风险。
+3. **投资建议**：根据当前数据，给出具体的持有、减仓或建仓建议，并说明理由。
+4. **适合人群**：该基金适合哪种风险偏好的投资者。
+
+要求：回复必须专业、客观、严谨，使用金融术语，总字数控制在700字左右。
+"""
+
+@lru_cache(maxsize=8)
+def _get_ai_client(api_key, base_url=DEEPSEEK_BASE_URL):
+    """
+    One client per (api_key, base_url), reused across analyses so its HTTP connection
+    pool (and the TLS session to DeepSeek) stays warm between requests.
+    """
+    return _OPENAI.OpenAI(api_key=api_key, base_url=base_url)
+
+def analyze_fund_with_ai(fund_code, api_key, endpoint_id, fund_name="", diagnosis=None):
     """
     Use DeepSeek AI to perform deep fund analysis.
+    Generator: yields the report text as it streams in (render with st.write_stream);
+    errors are yielded as a single message.
+    diagnosis: a diagnose_fund() result the caller already has; computed here if omitted.
     """
-    try:
-        import openai
-    except ImportError as e:
-        import sys
-        venv_path = os.path.join(os.path.dirname(__file__), "..", ".venv")
-        exists = "存在" if os.path.exists(venv_path) else "不存在"
-        return (
-            f"❌ **AI 诊断启动失败**\n\n"
-            f"原因: 找不到 `openai` 库 ({str(e)})\n\n"
-            f"**排查信息**:\n"
-            f"- 当前 Python: `{sys.executable}`\n"
-            f"- 虚拟环境 ({venv_path}): **{exists}**\n\n"
-            f"**解决方法**:\n"
-            f"1. 请确保已安装依赖：`pip install openai` 或运行目录下的 `run.bat`。\n"
-            f"2. 如果刚安装完，请**彻底关闭并重启** Streamlit 命令行窗口。"
-        )
-    except Exception as e:
-        return f"发生未知错误: {str(e)}"
+    if _OPENAI is None:
+        yield _openai_missing_msg("AI 诊断启动失败")
+        return
 
     if not api_key:
-        return "请先在侧边栏配置 DeepSeek API Key。"
+        yield "请先在侧边栏配置 DeepSeek API Key。"
+        return
 
     # Check for non-ASCII characters in API Key and Model ID to prevent encoding errors
     try:
         api_key.encode('ascii')
     except UnicodeEncodeError:
-        return "API Key 包含非法字符（可能是中文或全角符号），请切换到英文输入法重新输入。"
+        yield "API Key 包含非法字符（可能是中文或全角符号），请切换到英文输入法重新输入。"
+        return
         
     try:
         endpoint_id.encode('ascii')
     except UnicodeEncodeError:
-        return "模型名称 (Model Name) 包含非法字符，请使用纯英文（如 deepseek-chat）。"
+        yield "模型名称 (Model Name) 包含非法字符，请使用纯英文（如 deepseek-chat）。"
+        return
 
     try:
         # 1. Prepare Data for AI
-        diagnosis = diagnose_fund(fund_code)
+        if diagnosis is None:
+            diagnosis = diagnose_fund(fund_code)
         
         # 2. Setup OpenAI Client (Compatible with DeepSeek)
-        client = openai.OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com",
-        )
+        client = _get_ai_client(api_key)
 
         # 3. Construct Prompt
-        prompt = f"""
-你是一位专业的基金分析师。请针对以下基金进行深度诊断和投资建议。
+        prompt = _FUND_PROMPT.format_map({
+            'fund_name': fund_name,
+            'fund_code': fund_code,
+            **diagnosis['metrics'],
+            'score': diagnosis['score'],
+            'conclusion': diagnosis['conclusion'],
+        })
 
-基金名称：{fund_name}
-基金代码：{fund_code}
+        # 4. Call API (streamed, so the first tokens show up while the rest is generated)
+        stream = client.chat.completions.create(
+            model=endpoint_id,
+            messages=[
+                {"role": "system", "content": "你是一位专业的金融理财专家，擅长基金分析。"},
+                {"role": "user", "content": prompt},
+            ],
+            stream=True,
+        )
 
-近一年表现指标：
-- 累计收益率：{diagnosis['metrics']['return_1y']}
-- 最大回撤：{diagnosis['metrics']['max_drawdown']}
-- 夏普比率：{diagnosis['metrics']['sharpe']}
-- 综合评分：{diagnosis['score']} / 5.0
-- 系统初步结论：{diagnosis['conclusion']}
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
-请从以下几个维度进行专业分析：
-1. **业绩表现分析**：评价该基金在同类产品中的收益与风险控制能力。
-2. **风险评估**：分析其波动性和最大回撤背后的潜在风险。
-3. **投资建议**：根据当前数据，给出具体的持有、减仓或建仓建议，并说明理由。
-4. **适合人群**：该基金适合哪种风险偏好的投资者。
+    except Exception as e:
+        yield f"AI 分析失败: {str(e)}"
 
-要求：回复必须专业、客观、严谨，使用金融术语，总字数控制在700字左右。
+# Several funds in one request; DeepSeek's JSON mode needs the word "json" in the prompt
+_FUNDS_BATCH_PROMPT = """
+你是一位专业的基金分析师。请针对以下每只基金，结合其近一年表现指标给出简要诊断与投资建议。
+
+基金列表（JSON）：
+{funds_json}
+
+每只基金请从业绩表现、风险、持有/减仓/建仓建议三个方面分析，每只 200 字左右，要求专业、客观、严谨。
+请只输出一个 json 对象，键为基金代码，值为该基金的分析文本，例如：{{"000001": "分析内容..."}}
 """
 
-        # 4. Call API
-        completion = client.chat.completions.create(
+def analyze_funds_batch_with_ai(funds, api_key, endpoint_id):
+    """
+    Use DeepSeek AI to analyze several funds in a single request (one round trip instead of N).
+    funds: list of dicts with 'fund_code' and 'fund_name'.
+    Returns {fund_code: analysis text}; on failure every fund maps to the error message.
+    """
+    codes = [f['fund_code'] for f in funds]
+    if not codes:
+        return {}
+    
+    if _OPENAI is None:
+        return dict.fromkeys(codes, _openai_missing_msg("AI 批量诊断启动失败"))
+    
+    if not api_key:
+        return dict.fromkeys(codes, "请先在侧边栏配置 DeepSeek API Key。")
+    
+    # Check for non-ASCII characters
+    try:
+        api_key.encode('ascii')
+        endpoint_id.encode('ascii')
+    except UnicodeEncodeError:
+        return dict.fromkeys(codes, "API Key 或模型名称包含非法字符，请切换到英文输入法重新输入。")
+    
+    try:
+        # 1. Metrics for every fund, screened in one batch
+        diagnoses = diagnose_funds_batch(codes)
+        fund_rows = [
+            {
+                'code': f['fund_code'],
+                'name': f.get('fund_name', ''),
+                **diagnoses[f['fund_code']]['metrics'],
+                'score': diagnoses[f['fund_code']]['score'],
+            }
+            for f in funds
+        ]
+        prompt = _FUNDS_BATCH_PROMPT.format_map({'funds_json': json.dumps(fund_rows, ensure_ascii=False)})
+        
+        # 2. One call, structured output
+        completion = _get_ai_client(api_key).chat.completions.create(
             model=endpoint_id,
             messages=[
                 {"role": "system", "content": "你是一位专业的金融理财专家，擅长基金分析。"},
                 {"role": "user", "content": prompt},
             ],
+            response_format={"type": "json_object"},
         )
-
-        return completion.choices[0].message.content
-
+        analyses = json.loads(completion.choices[0].message.content)
+        if not isinstance(analyses, dict):
+            return dict.fromkeys(codes, "AI 返回格式异常，请重试。")
+        
+        results = {}
+        for code in codes:
+            text = analyses.get(code)
+            if not text:
+                text = "AI 未返回该基金的分析。"
+            elif not isinstance(text, str):
+                # The model sometimes nests the sections as an object; show it as JSON rather than a repr
+                text = json.dumps(text, ensure_ascii=False, indent=2)
+            results[code] = text
+        return results
+    
     except Exception as e:
-        return f"AI 分析失败: {str(e)}"
+        return dict.fromkeys(codes, f"AI 批量分析失败: {str(e)}")
 
 def analyze_portfolio_with_ai(holdings, api_key, endpoint_id):
     """
     Use DeepSeek AI to perform portfolio diagnosis.
     holdings: List of dicts [{'fund_code':..., 'fund_name':..., 'share':..., 'cost_price':...}, ...]
+    Generator: yields the report text as it streams in (render with st.write_stream);
+    errors are yielded as a single message.
     """
-    try:
-        import openai
-    except ImportError as e:
-        import sys
-        venv_path = os.path.join(os.path.dirname(__file__), "..", ".venv")
-        exists = "存在" if os.path.exists(venv_path) else "不存在"
-        return (
-            f"❌ **投资组合诊断启动失败**\n\n"
-            f"原因: 找不到 `openai` 库 ({str(e)})\n\n"
-            f"**排查信息**:\n"
-            f"- 当前 Python: `{sys.executable}`\n"
-            f"- 虚拟环境 ({venv_path}): **{exists}**\n\n"
-            f"**解决方法**:\n"
-            f"1. 请确保已安装依赖：`pip install openai` 或运行目录下的 `run.bat`。\n"
-            f"2. 如果刚安装完，请**彻底关闭并重启** Streamlit 命令行窗口。"
-        )
-    except Exception as e:
-        return f"发生未知错误: {str(e)}"
+    if _OPENAI is None:
+        yield _openai_missing_msg("投资组合诊断启动失败")
+        return
 
     if not api_key:
-        return "请先在侧边栏配置 DeepSeek API Key。"
+        yield "请先在侧边栏配置 DeepSeek API Key。"
+        return
 
     # Check for non-ASCII characters
     try:
         api_key.encode('ascii')
     except UnicodeEncodeError:
-        return "API Key 包含非法字符（可能是中文或全角符号），请切换到英文输入法重新输入。"
+        yield "API Key 包含非法字符（可能是中文或全角符号），请切换到英文输入法重新输入。"
+        return
         
     try:
         endpoint_id.encode('ascii')
     except UnicodeEncodeError:
-        return "模型名称 (Model Name) 包含非法字符，请使用纯英文（如 deepseek-chat）。"
+        yield "模型名称 (Model Name) 包含非法字符，请使用纯英文（如 deepseek-chat）。"
+        return
 
     if not holdings or len(holdings) == 0:
-        return "当前持仓为空，无法进行分析。"
+        yield "当前持仓为空，无法进行分析。"
+        return
 
     try:
         # 1. Prepare Portfolio Data for Prompt
@@ -175,10 +281,7 @@ def analyze_portfolio_with_ai(holdings, api_key, endpoint_id):
             portfolio_desc += f"{idx+1}. {h['fund_name']} ({h['fund_code']}): 持有 {h['share']:.2f}份，成本 {h['cost_price']:.4f}\n"
 
         # 2. Setup OpenAI Client
-        client = openai.OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com",
-        )
+        client = _get_ai_client(api_key)
 
         # 3. Construct Prompt
         prompt = f"""
@@ -203,19 +306,48 @@ def analyze_portfolio_with_ai(holdings, api_key, endpoint_id):
 - 总字数控制在700字左右。
 """
 
-        # 4. Call API
-        completion = client.chat.completions.create(
+        # 4. Call API (streamed, so the first tokens show up while the rest is generated)
+        stream = client.chat.completions.create(
             model=endpoint_id,
             messages=[
                 {"role": "system", "content": "你是一位专业的投资组合管理专家。"},
                 {"role": "user", "content": prompt},
             ],
+            stream=True,
         )
 
-        return completion.choices[0].message.content
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
     except Exception as e:
-        return f"AI 组合分析失败: {str(e)}"
+        yield f"AI 组合分析失败: {str(e)}"
+
+# Fund-name keyword -> sector heuristic for the local portfolio report
+_SECTOR_KEYWORDS = {
+    "债": "债券/固收",
+    "医": "医药健康",
+    "药": "医药健康",
+    "能": "新能源/周期",
+    "光伏": "新能源/周期",
+    "酒": "消费/白酒",
+    "消费": "消费/白酒",
+    "科": "科技/TMT",
+    "芯": "科技/TMT",
+    "半导体": "科技/TMT",
+    "指": "指数/宽基",
+    "300": "指数/宽基",
+    "500": "指数/宽基",
+    "纳斯达克": "海外/QDII",
+    "标普": "海外/QDII"
+}
+# Each sector's keywords are contiguous in the dict, so testing sectors in order ==
+# the first matching keyword wins (first-match priority)
+_SECTORS = list(dict.fromkeys(_SECTOR_KEYWORDS.values()))
+_SECTOR_PATTERNS = [
+    re.compile('|'.join(re.escape(kw) for kw, s in _SECTOR_KEYWORDS.items() if s == sector))
+    for sector in _SECTORS
+]
 
 def analyze_portfolio_locally(holdings_list):
     """
@@ -247,14 +379,14 @@ def analyze_portfolio_locally(holdings_list):
     # We need current market value for weighting. 
     # If not present, we fetch latest estimates.
     if 'market_value' not in df.columns:
-        # Fetch current prices
-        current_values = []
-        for _, row in df.iterrows():
-            est = data_api.get_real_time_estimate(row['fund_code'])
-            price = float(est['gz']) if est and est.get('gz') else row['cost_price']
-            val = price * row['share']
-            current_values.append(val)
-        df['market_value'] = current_values
+        # Fetch current prices (one parallel batch, as on the holdings page)
+        codes = df['fund_code'].tolist()
+        batch_data = data_api.get_batch_realtime_estimates(codes)
+        prices = []
+        for code, cost in zip(codes, df['cost_price']):
+            est = data_api.get_real_time_estimate(code, pre_fetched_data=batch_data.get(code))
+            prices.append(float(est['gz']) if est and est.get('gz') else cost)
+        df['market_value'] = np.asarray(prices, dtype=np.float64) * df['share']
         
     total_assets = df['market_value'].sum()
     if total_assets == 0:
@@ -264,9 +396,10 @@ def analyze_portfolio_locally(holdings_list):
     df['profit_rate'] = (df['market_value'] - (df['cost_price'] * df['share'])) / (df['cost_price'] * df['share'])
     
     # 1. Concentration Analysis
-    top1_fund = df.sort_values('weight', ascending=False).iloc[0]
-    top3_funds = df.sort_values('weight', ascending=False).head(3)
-    top3_weight = top3_funds['weight'].sum()
+    # Only the top-3 total is needed, so partition instead of sorting the whole frame
+    w = df['weight'].to_numpy()
+    k = min(3, len(w))
+    top3_weight = w[np.argpartition(-w, k - 1)[:k]].sum()
     
     conc_text = ""
     if top3_weight > 0.8:
@@ -287,36 +420,11 @@ def analyze_portfolio_locally(holdings_list):
         div_text = f"持仓数量适中（{fund_count}只），便于管理和跟踪。"
         
     # 3. Sector/Style Inference (Heuristic)
-    keywords = {
-        "债": "债券/固收",
-        "医": "医药健康",
-        "药": "医药健康",
-        "能": "新能源/周期",
-        "光伏": "新能源/周期",
-        "酒": "消费/白酒",
-        "消费": "消费/白酒",
-        "科": "科技/TMT",
-        "芯": "科技/TMT",
-        "半导体": "科技/TMT",
-        "指": "指数/宽基",
-        "300": "指数/宽基",
-        "500": "指数/宽基",
-        "纳斯达克": "海外/QDII",
-        "标普": "海外/QDII"
-    }
-    
-    sector_weights = {}
-    for _, row in df.iterrows():
-        name = row['fund_name']
-        found = False
-        for kw, sector in keywords.items():
-            if kw in name:
-                sector_weights[sector] = sector_weights.get(sector, 0) + row['weight']
-                found = True
-                # Don't break, a name could match multiple (rarely), but let's count first match priority or just first
-                break 
-        if not found:
-            sector_weights["其他/混合"] = sector_weights.get("其他/混合", 0) + row['weight']
+    # One vectorized substring scan per sector (patterns compiled once at import)
+    names = df['fund_name'].astype(str)
+    masks = [names.str.contains(pattern, regex=True) for pattern in _SECTOR_PATTERNS]
+    fund_sectors = pd.Series(np.select(masks, _SECTORS, default="其他/混合"), index=df.index)
+    sector_weights = df['weight'].groupby(fund_sectors, sort=False).sum().to_dict()
             
     # Find dominant sector
     sorted_sectors = sorted(sector_weights.items(), key=lambda x: x[1], reverse=True)
@@ -362,35 +470,6 @@ def analyze_portfolio_locally(holdings_list):
 """
     return report
 
-def optimize_holdings(holdings_df):
-    """
-    Generate short tips for dashboard.
-    """
-    tips = []
-    if holdings_df.empty: return tips
-    
-    # Check max drawdown risk (using a proxy if no historical data)
-    # Here we check profit rate
-    deep_loss = holdings_df[holdings_df['profit_rate'] < -0.15]
-    if not deep_loss.empty:
-        names = deep_loss['fund_name'].tolist()
-        tips.append(f"亏损预警：{', '.join(names[:2])} 等 {len(names)} 只基金亏损超过15%，建议进行深度诊断决定去留。")
-        
-    # Check concentration
-    if len(holdings_df) > 0:
-        total = holdings_df['market_value'].sum()
-        if total > 0:
-            weights = holdings_df['market_value'] / total
-            if weights.max() > 0.4:
-                top_name = holdings_df.loc[weights.idxmax(), 'fund_name']
-                tips.append(f"重仓提示：单一基金 {top_name} 占比超过40%，建议适当分散。")
-                
-    # Check count
-    if len(holdings_df) > 10:
-        tips.append(f"持仓过杂：当前持有 {len(holdings_df)} 只基金，建议精简至 5-8 只优质核心基金。")
-        
-    return tips
-
 def calculate_sip_returns(fund_code, amount, frequency, duration_years=3, execution_day=None):
     """
     Simulate SIP (定投) returns based on historical data.
@@ -414,9 +493,8 @@ def calculate_sip_returns(fund_code, amount, frequency, duration_years=3, execut
     if '净值日期' in df.columns:
         df = df.rename(columns={'净值日期': '日期'})
         
-    df = df[df['日期'] >= start_date].sort_values('日期') # Ascending
-    
-    # Convert execution_day to int safely
+    # History comes sorted ascending, so the window start is one binary search
+    df = df.iloc[df['日期'].searchsorted(pd.Timestamp(start_date), side='left'):]
     
     # Convert execution_day to int safely
     exec_day_int = 1 
@@ -425,74 +503,43 @@ def calculate_sip_returns(fund_code, amount, frequency, duration_years=3, execut
             exec_day_int = int(execution_day)
         except:
             pass
-            
-    total_invested = 0
-    total_share = 0
-    invest_log = []
     
     # Logic for specific day
     # Robust Logic: Invest on the first available trading day on or after the target day within the period
+    dates = df['日期']
+    if frequency == '每周':
+        # ISO year-week packed into one int (e.g. 202301); target weekday: 0=Mon ... 4=Fri
+        target_weekday = min(max(exec_day_int - 1, 0), 4)
+        iso = dates.dt.isocalendar()
+        period = iso['year'].astype(np.int64) * 100 + iso['week'].astype(np.int64)
+        eligible = dates.dt.weekday >= target_weekday
+    elif frequency == '每月':
+        # Year-month packed the same way (e.g. 202301)
+        period = dates.dt.year * 100 + dates.dt.month
+        eligible = dates.dt.day >= exec_day_int
+    else:
+        return None
     
-    last_invested_period = None # "2023-01" for monthly, "2023-W01" for weekly
-    
-    for idx, row in df.iterrows():
-        current_date = pd.to_datetime(row['日期'])
-        current_nav = row['单位净值']
-        
-        should_invest = False
-        current_period = None
-        
-        if frequency == '每周':
-            # ISO Year-Week (e.g., 2023-01)
-            year, week, _ = current_date.isocalendar()
-            current_period = f"{year}-{week:02d}"
-            
-            # Target weekday: 0=Mon ... 4=Fri
-            target_weekday = exec_day_int - 1
-            if target_weekday < 0: target_weekday = 0
-            if target_weekday > 4: target_weekday = 4
-            
-            # If we haven't invested this week yet
-            if current_period != last_invested_period:
-                # Check if today is on or after the target weekday
-                if current_date.weekday() >= target_weekday:
-                    should_invest = True
-            
-        elif frequency == '每月':
-            current_period = current_date.strftime("%Y-%m")
-            
-            # If we haven't invested this month yet
-            if current_period != last_invested_period:
-                # Check if today is on or after the target day
-                if current_date.day >= exec_day_int:
-                    should_invest = True
-            
-        if should_invest:
-            share = amount / current_nav
-            total_share += share
-            total_invested += amount
-            invest_log.append({
-                'date': row['日期'],
-                'nav': current_nav,
-                'accumulated_share': total_share,
-                'total_invested': total_invested,
-                'market_value': total_share * current_nav
-            })
-            last_invested_period = current_period
-            
-    if not invest_log:
+    # One buy per period: the first eligible trading day (rows are in date order)
+    buys = df[eligible].groupby(period[eligible], sort=False).head(1)
+    if buys.empty:
         # Fallback if strict day matching failed (e.g. only holidays matched)
         return None
-
-    trend_values = [x['market_value'] for x in invest_log]
+    
+    buy_navs = buys['单位净值'].to_numpy(np.float64)
+    accumulated_share = np.cumsum(amount / buy_navs)
+    total_share = accumulated_share[-1]
+    total_invested = amount * len(buy_navs)
+    trend = accumulated_share * buy_navs
+    trend_values = trend.tolist()
     
     final_nav = df.iloc[-1]['单位净值']
     final_value = total_share * final_nav
     yield_rate = (final_value - total_invested) / total_invested if total_invested > 0 else 0
     
     # Create dummy optimistic/pessimistic for chart visual effect (just +/- 10% on the trend)
-    optimistic_trend = [v * 1.1 for v in trend_values]
-    pessimistic_trend = [v * 0.9 for v in trend_values]
+    optimistic_trend = (trend * 1.1).tolist()
+    pessimistic_trend = (trend * 0.9).tolist()
     
     return {
         'neutral': {
@@ -505,48 +552,52 @@ def calculate_sip_returns(fund_code, amount, frequency, duration_years=3, execut
         'pessimistic': {'trend': pessimistic_trend}
     }
 
-def analyze_fund_locally(fund_code, fund_name=""):
+# Local expert-report text tables, ordered by ascending band.
+# 1. Performance: return_1y (%) <= -5 | <= 5 | <= 20 | > 20
+_PERF_BANDS = (-5, 5, 20)
+_PERF_TEXTS = (
+    "该基金近一年收益率为{ret}%，表现不尽如人意。收益水平大幅落后于同类平均水平，可能受到行业板块回调或基金经理投资策略失误的影响。",
+    "该基金近一年收益率为{ret}%，处于微盈或微亏状态。整体表现中规中矩，基本随大盘波动，未显示出明显的超额收益获取能力。",
+    "该基金近一年收益率为{ret}%，表现稳健。在复杂多变的市场环境下，能够实现正收益并超越多数同类产品，体现了较好的抗风险能力和增长潜力。",
+    "该基金近一年收益率高达{ret}%，表现极其亮眼，大幅跑赢市场主流指数。其优秀的盈利能力显示出基金经理在当前市场环境中具备极强的择时或选股能力。",
+)
+# 2. Risk: max_drawdown (%) < 10 | < 25 | >= 25
+_RISK_BANDS = (10, 25)
+_RISK_TEXTS = (
+    "回撤控制极其出色（最大回撤仅{mdd}%）。这表明该基金在市场下跌时具备极强的防御性，适合追求稳健、对波动敏感的投资者。",
+    "最大回撤为{mdd}%，处于行业平均水平。虽然存在一定波动，但整体风险尚在可控范围内，属于典型的风险收益对等型产品。",
+    "最大回撤高达{mdd}%，波动风险显著。这通常意味着该基金投资风格激进或持仓过于集中，在市场剧烈波动时可能会面临较大的净值损失。",
+)
+# 3. Suggestion: score < 2.5 | < 3.5 | < 4.5 | >= 4.5
+_SUGGESTION_BANDS = (2.5, 3.5, 4.5)
+_SUGGESTION_TEXTS = (
+    "【减仓/避让】综合指标较差，风险收益比偏低。建议审视该基金的底层逻辑是否发生改变，若无明显改善迹象，可考虑逢高减仓以规避进一步损失。",
+    "【观望】当前性价比一般，建议暂不加仓。可观察其在下一阶段市场反弹中的修复能力，若持续低迷可考虑逐步置换为同类更优品种。",
+    "【持有】基金表现良好，收益与风险控制较为平衡。建议维持现有仓位，密切关注市场风格切换对该基金底层资产的影响。",
+    "【持有/加仓】该基金综合评分极高，各项指标均表现优异。对于已有持仓的投资者，建议继续坚定持有；对于关注该领域的投资者，可考虑在回调时分批建仓。",
+)
+
+def analyze_fund_locally(fund_code, fund_name="", diagnosis=None):
     """
     Perform deep analysis using a local expert system (Rule-based).
     No API Key required.
+    diagnosis: a diagnose_fund() result the caller already has; computed here if omitted.
     """
-    diagnosis = diagnose_fund(fund_code)
+    if diagnosis is None:
+        diagnosis = diagnose_fund(fund_code)
     if diagnosis['score'] == 0:
         return "数据不足，无法生成本地深度分析。"
 
-    metrics = diagnosis['metrics']
-    ret = float(metrics['return_1y'].replace('%', ''))
-    mdd = float(metrics['max_drawdown'].replace('%', ''))
-    sharpe = float(metrics['sharpe'])
+    metrics = diagnosis['metrics_raw']
+    ret = metrics['return_1y']
+    mdd = metrics['max_drawdown']
+    sharpe = metrics['sharpe']
     score = diagnosis['score']
 
-    # 1. Performance Analysis
-    if ret > 20:
-        perf_text = f"该基金近一年收益率高达{ret}%，表现极其亮眼，大幅跑赢市场主流指数。其优秀的盈利能力显示出基金经理在当前市场环境中具备极强的择时或选股能力。"
-    elif ret > 5:
-        perf_text = f"该基金近一年收益率为{ret}%，表现稳健。在复杂多变的市场环境下，能够实现正收益并超越多数同类产品，体现了较好的抗风险能力和增长潜力。"
-    elif ret > -5:
-        perf_text = f"该基金近一年收益率为{ret}%，处于微盈或微亏状态。整体表现中规中矩，基本随大盘波动，未显示出明显的超额收益获取能力。"
-    else:
-        perf_text = f"该基金近一年收益率为{ret}%，表现不尽如人意。收益水平大幅落后于同类平均水平，可能受到行业板块回调或基金经理投资策略失误的影响。"
-
-    # 2. Risk Assessment
-    if mdd < 10:
-        risk_text = f"回撤控制极其出色（最大回撤仅{mdd}%）。这表明该基金在市场下跌时具备极强的防御性，适合追求稳健、对波动敏感的投资者。"
-    elif mdd < 25:
-        risk_text = f"最大回撤为{mdd}%，处于行业平均水平。虽然存在一定波动，但整体风险尚在可控范围内，属于典型的风险收益对等型产品。"
-    else:
-        risk_text = f"最大回撤高达{mdd}%，波动风险显著。这通常意味着该基金投资风格激进或持仓过于集中，在市场剧烈波动时可能会面临较大的净值损失。"
-
-    # 3. Investment Suggestion
-    if score >= 4.5:
-        sugg_text = "【持有/加仓】该基金综合评分极高，各项指标均表现优异。对于已有持仓的投资者，建议继续坚定持有；对于关注该领域的投资者，可考虑在回调时分批建仓。"
-    elif score >= 3.5:
-        sugg_text = "【持有】基金表现良好，收益与风险控制较为平衡。建议维持现有仓位，密切关注市场风格切换对该基金底层资产的影响。"
-    elif score >= 2.5:
-        sugg_text = "【观望】当前性价比一般，建议暂不加仓。可观察其在下一阶段市场反弹中的修复能力，若持续低迷可考虑逐步置换为同类更优品种。"
-    else:
-        sugg_text = "【减仓/避让】综合指标较差，风险收益比偏低。建议审视该基金的底层逻辑是否发生改变，若无明显改善迹象，可考虑逢高减仓以规避进一步损失。"
+    # 1-3: each section is a table lookup by which threshold band the metric falls in
+    perf_text = _PERF_TEXTS[bisect.bisect_left(_PERF_BANDS, ret)].format(ret=ret)
+    risk_text = _RISK_TEXTS[bisect.bisect_right(_RISK_BANDS, mdd)].format(mdd=mdd)
+    sugg_text = _SUGGESTION_TEXTS[bisect.bisect_right(_SUGGESTION_BANDS, score)]
 
     # 4. Suitable Audience
     if mdd < 15 and sharpe > 1.0:
@@ -578,69 +629,217 @@ def analyze_fund_locally(fund_code, fund_name=""):
 
 def calculate_max_drawdown(nav_series):
     """
-    Calculate Maximum Drawdown of a NAV series.
+    Calculate Maximum Drawdown of a NAV series (Series or array).
     """
-    roll_max = nav_series.cummax()
-    drawdown = (nav_series - roll_max) / roll_max
-    max_drawdown = drawdown.min()
-    return abs(max_drawdown)
+    navs = np.asarray(nav_series, dtype=np.float64)
+    # fmax skips NaN like cummax() does
+    roll_max = np.fmax.accumulate(navs)
+    # 1 - nav/peak in place: one temporary instead of two
+    drawdown = np.divide(navs, roll_max, out=roll_max)
+    np.subtract(1.0, drawdown, out=drawdown)
+    return float(np.nanmax(drawdown))
 
 def calculate_sharpe_ratio(nav_series, risk_free_rate=0.03):
     """
-    Calculate annualized Sharpe Ratio.
+    Calculate annualized Sharpe Ratio (Series or array).
     """
-    returns = nav_series.pct_change().dropna()
-    if returns.std() == 0:
+    navs = np.asarray(nav_series, dtype=np.float64)
+    returns = navs[1:] / navs[:-1] - 1
+    returns = returns[~np.isnan(returns)]
+    # A sample std needs at least two returns
+    if returns.size < 2:
         return 0
-    excess_returns = returns - (risk_free_rate / 252)
-    sharpe = np.sqrt(252) * excess_returns.mean() / returns.std()
-    return sharpe
+    std = returns.std(ddof=1)
+    if std == 0:
+        return 0
+    return float(np.sqrt(252) * (returns.mean() - risk_free_rate / 252) / std)
+
+def _nav_metrics(navs, risk_free_rate=0.03):
+    """
+    (total_return, max_drawdown, sharpe) from one float64 NAV array.
+    The array is converted once; the two functions above then work on it without copies.
+    """
+    navs = np.asarray(navs, dtype=np.float64)
+    total_return = (navs[-1] - navs[0]) / navs[0]
+    return float(total_return), calculate_max_drawdown(navs), calculate_sharpe_ratio(navs, risk_free_rate)
+
+# Scoring steps: each threshold crossed adds (or takes) 0.5 from the base score of 3
+_RETURN_BONUS_STEPS = np.array([0.1, 0.2])        # return > step: +0.5 each
+_RETURN_PENALTY_STEPS = np.array([-0.1, -0.2])    # return < step: -0.5 each
+_DRAWDOWN_BONUS_STEPS = np.array([0.1])           # drawdown < step: +0.5
+_DRAWDOWN_PENALTY_STEPS = np.array([0.25, 0.35])  # drawdown > step: -0.5 each
+_SHARPE_BONUS_STEPS = np.array([1.5])             # sharpe > step: +0.5
+
+def _score_metrics(total_return, max_dd, sharpe):
+    """
+    Score (1-5) from the diagnosis metrics, as threshold counts instead of if/elif chains.
+    Works elementwise, so arrays of metrics (many funds) score in one call.
+    """
+    r = np.asarray(total_return, dtype=np.float64)[..., None]
+    dd = np.asarray(max_dd, dtype=np.float64)[..., None]
+    sr = np.asarray(sharpe, dtype=np.float64)[..., None]
+    steps = ((r > _RETURN_BONUS_STEPS).sum(-1) - (r < _RETURN_PENALTY_STEPS).sum(-1)
+             + (dd < _DRAWDOWN_BONUS_STEPS).sum(-1) - (dd > _DRAWDOWN_PENALTY_STEPS).sum(-1)
+             + (sr > _SHARPE_BONUS_STEPS).sum(-1))
+    # Clamp score 1-5
+    return np.clip(3.0 + 0.5 * steps, 1.0, 5.0)
+
+# --- Diagnosis cache ---
+# A diagnosis only changes when a new NAV lands, so it is keyed by (fund_code, NAV cache bucket):
+# the same day / hourly-after-20:00 bucket as data_api's history cache, so a result computed before
+# the evening NAV is published is recomputed once it is. In-process dict first, then a JSON file
+# that survives Streamlit restarts.
+DIAGNOSE_CACHE_DIR = os.path.join('.cache', 'diagnose')
+# Part of the file name; bump when the result dict's shape changes so stale files are ignored
+DIAGNOSE_CACHE_VERSION = 3
+_diagnose_cache = {}
+# Bucket the in-process entries belong to; they are dropped when it rolls over
+_diagnose_cache_bucket = [None]
+
+def _current_diagnose_bucket():
+    bucket = data_api.nav_cache_bucket()
+    if bucket != _diagnose_cache_bucket[0]:
+        _diagnose_cache.clear()
+        _diagnose_cache_bucket[0] = bucket
+    return bucket
+
+def _load_diagnose_cache(fund_code, bucket):
+    path = os.path.join(DIAGNOSE_CACHE_DIR, f"{fund_code}_{bucket}_v{DIAGNOSE_CACHE_VERSION}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading diagnosis cache for {fund_code}: {e}")
+        return None
+
+def _save_diagnose_cache(fund_code, bucket, result):
+    fname = f"{fund_code}_{bucket}_v{DIAGNOSE_CACHE_VERSION}.json"
+    try:
+        os.makedirs(DIAGNOSE_CACHE_DIR, exist_ok=True)
+        path = os.path.join(DIAGNOSE_CACHE_DIR, fname)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        
+        # Drop this fund's files from earlier buckets
+        for old in os.listdir(DIAGNOSE_CACHE_DIR):
+            if old.startswith(f"{fund_code}_") and old != fname and old.endswith('.json'):
+                os.remove(os.path.join(DIAGNOSE_CACHE_DIR, old))
+    except Exception as e:
+        print(f"Error writing diagnosis cache for {fund_code}: {e}")
+
+# Minimum NAV points in the 1-year window for a rating
+_MIN_DIAGNOSE_POINTS = 100
+
+def _diagnosis_window_start():
+    # Last 1 year for diagnosis
+    return (datetime.datetime.now() - datetime.timedelta(days=365)).strftime('%Y-%m-%d')
+
+def _remember_diagnosis(key, result, persist):
+    """Put a result in the in-process cache (and on disk if freshly computed); "数据不足" is never cached."""
+    if result['score'] > 0:
+        if persist:
+            _save_diagnose_cache(*key, result)
+        _diagnose_cache[key] = result
 
 def diagnose_fund(fund_code):
     """
     Perform a comprehensive diagnosis on a fund.
     Returns a score (1-5) and detailed metrics.
+    Cached per NAV cache bucket; "数据不足" results are not cached so a failed fetch is retried.
     """
-    # 1. Fetch History (Last 1 year for diagnosis)
-    end_date = datetime.datetime.now()
-    start_date = end_date - datetime.timedelta(days=365)
-    
-    df = get_fund_nav_history(fund_code, start_date=start_date.strftime('%Y-%m-%d'))
-    
-    if df.empty or len(df) < 100:
-        return {
-            'score': 0.0,
-            'stars': 'N/A',
-            'conclusion': '数据不足，无法准确评级。',
-            'metrics': {'return_1y': '--', 'max_drawdown': '--', 'sharpe': '--'}
-        }
-    
-    # 2. Calculate Metrics
-    navs = df['单位净值']
-    total_return = (navs.iloc[-1] - navs.iloc[0]) / navs.iloc[0]
-    max_dd = calculate_max_drawdown(navs)
-    sharpe = calculate_sharpe_ratio(navs)
-    
-    # 3. Scoring Logic (Simplified Model)
-    # Score starts at 3
-    score = 3.0
-    
-    # Return Bonus/Penalty
-    if total_return > 0.2: score += 1.0
-    elif total_return > 0.1: score += 0.5
-    elif total_return < -0.1: score -= 0.5
-    elif total_return < -0.2: score -= 1.0
-    
-    # Risk Penalty (Drawdown)
-    if max_dd < 0.1: score += 0.5
-    elif max_dd > 0.25: score -= 0.5
-    elif max_dd > 0.35: score -= 1.0
+    key = (fund_code, _current_diagnose_bucket())
+    result = _diagnose_cache.get(key)
+    if result is None:
+        result = _load_diagnose_cache(*key)
+        persist = result is None
+        if persist:
+            result = _diagnose_fund_uncached(fund_code)
+        _remember_diagnosis(key, result, persist)
+    # Callers get their own copy so they can't mutate the cached dict
+    return copy.deepcopy(result)
+
+def diagnose_funds_batch(fund_codes):
+    """
+    Diagnose many funds at once (portfolio screening). Returns {fund_code: diagnosis}.
+    Cache misses have their histories warmed in parallel, then all metrics and scores are
+    computed column-wise on one (dates x funds) array instead of fund by fund.
+    """
+    bucket = _current_diagnose_bucket()
+    codes = list(dict.fromkeys(fund_codes))
+    results = {}
+    missing = []
+    for code in codes:
+        key = (code, bucket)
+        result = _diagnose_cache.get(key)
+        if result is None:
+            result = _load_diagnose_cache(*key)
+            if result is not None:
+                _remember_diagnosis(key, result, persist=False)
+        if result is None:
+            missing.append(code)
+        else:
+            results[code] = result
     
-    # Sharpe Bonus
-    if sharpe > 1.5: score += 0.5
+    if missing:
+        # Parallel downloads on the shared pool; the per-fund calls below are then cache hits
+        data_api.prefetch_data(missing)
+        start_date = _diagnosis_window_start()
+        nav_columns = {}
+        return_columns = {}
+        for code in missing:
+            dates, navs = get_fund_nav_array(code, start_date=start_date)
+            if len(navs) < _MIN_DIAGNOSE_POINTS:
+                results[code] = _insufficient_diagnosis()
+                continue
+            nav_columns[code] = pd.Series(navs, index=dates)
+            # Returns are taken along each fund's own NAV dates, before aligning to the union of dates
+            return_columns[code] = pd.Series(navs[1:] / navs[:-1] - 1, index=dates[1:])
+        
+        if nav_columns:
+            rated = list(nav_columns)
+            # (T, N): forward-filled NAVs (leading NaN before a fund's first date) and its returns
+            nav_frame = pd.concat(nav_columns, axis=1).sort_index()
+            navs = nav_frame.ffill().to_numpy(np.float64)
+            rets = pd.concat(return_columns, axis=1).reindex(nav_frame.index).to_numpy(np.float64)
+            cols = np.arange(navs.shape[1])
+            
+            first = navs[(~np.isnan(navs)).argmax(axis=0), cols]
+            total_returns = (navs[-1] - first) / first
+            
+            roll_max = np.fmax.accumulate(navs, axis=0)
+            max_dds = np.abs(np.nanmin((navs - roll_max) / roll_max, axis=0))
+            
+            counts = (~np.isnan(rets)).sum(axis=0)
+            means = np.nanmean(rets, axis=0)
+            stds = np.nanstd(rets, axis=0, ddof=1)
+            valid = (counts >= 2) & (stds != 0)
+            sharpes = np.where(valid, np.sqrt(252) * (means - 0.03 / 252) / np.where(valid, stds, 1.0), 0.0)
+            
+            scores = _score_metrics(total_returns, max_dds, sharpes)
+            for n, code in enumerate(rated):
+                results[code] = _diagnosis_result(float(total_returns[n]), float(max_dds[n]),
+                                                  float(sharpes[n]), float(scores[n]))
+        
+        for code in missing:
+            _remember_diagnosis((code, bucket), results[code], persist=True)
     
-    # Clamp score 1-5
-    score = max(1.0, min(5.0, score))
+    return {code: copy.deepcopy(results[code]) for code in codes}
+
+def _insufficient_diagnosis():
+    return {
+        'score': 0.0,
+        'stars': 'N/A',
+        'conclusion': '数据不足，无法准确评级。',
+        'metrics': {'return_1y': '--', 'max_drawdown': '--', 'sharpe': '--'},
+        'metrics_raw': {'return_1y': None, 'max_drawdown': None, 'sharpe': None}
+    }
+
+def _diagnosis_result(total_return, max_dd, sharpe, score):
+    """Build the diagnosis dict from the metrics and the 1-5 score."""
     stars = '⭐' * int(score) + ('½' if score % 1 >= 0.5 else '')
     
     # Conclusion
@@ -657,9 +856,29 @@ def diagnose_fund(fund_code):
             'return_1y': f"{total_return*100:.2f}%",
             'max_drawdown': f"{max_dd*100:.2f}%",
             'sharpe': f"{sharpe:.2f}"
+        },
+        # Same values as numbers (percent units, 2 decimals) for rule engines, so nobody re-parses the strings
+        'metrics_raw': {
+            'return_1y': round(total_return * 100, 2),
+            'max_drawdown': round(max_dd * 100, 2),
+            'sharpe': round(sharpe, 2)
         }
     }
 
+def _diagnose_fund_uncached(fund_code):
+    # 1. Fetch History (Last 1 year for diagnosis)
+    _, navs = get_fund_nav_array(fund_code, start_date=_diagnosis_window_start())
+    
+    if len(navs) < _MIN_DIAGNOSE_POINTS:
+        return _insufficient_diagnosis()
+    
+    # 2. Calculate Metrics
+    total_return, max_dd, sharpe = _nav_metrics(navs)
+    
+    # 3. Scoring Logic (Simplified Model)
+    score = float(_score_metrics(total_return, max_dd, sharpe))
+    return _diagnosis_result(total_return, max_dd, sharpe, score)
+
 def project_investment_plan(fund_code, amount, freq_days, duration_years):
     """
     Project investment plan returns (Optimistic, Neutral, Pessimistic).
@@ -668,61 +887,58 @@ def project_investment_plan(fund_code, amount, freq_days, duration_years):
     # Fetch long history (3 years)
     end_date = datetime.datetime.now()
     start_date = end_date - datetime.timedelta(days=365*3)
-    df = get_fund_nav_history(fund_code, start_date=start_date.strftime('%Y-%m-%d'))
+    _, navs = get_fund_nav_array(fund_code, start_date=start_date.strftime('%Y-%m-%d'))
     
-    if df.empty:
+    if navs.size == 0:
         return None
         
-    # Calculate historical annual returns rolling
-    df['pct_change'] = df['单位净值'].pct_change()
-    daily_mean = df['pct_change'].mean()
-    daily_std = df['pct_change'].std()
+    # Historical daily return stats, straight off the NAV array (NaN returns skipped like pandas does)
+    returns = navs[1:] / navs[:-1] - 1
+    returns = returns[~np.isnan(returns)]
+    daily_mean = returns.mean() if returns.size else np.nan
+    daily_std = returns.std(ddof=1) if returns.size > 1 else np.nan
     
     # Annualize
     annual_mean = daily_mean * 252
     annual_std = daily_std * (252**0.5)
     
-    # Scenarios (Annual Return rates)
-    scenarios = {
-        'optimistic': annual_mean + annual_std, # Mean + 1 StdDev
-        'neutral': annual_mean,
-        'pessimistic': annual_mean - annual_std # Mean - 1 StdDev
-    }
+    # Scenarios (Annual Return rates): Mean + 1 StdDev, Mean, Mean - 1 StdDev
+    scenario_names = ('optimistic', 'neutral', 'pessimistic')
+    annual_rates = np.array([annual_mean + annual_std, annual_mean, annual_mean - annual_std])
     
     # Projection Calculation
-    # Simple compound interest for regular contribution
-    # FV = P * ((1+r)^n - 1) / r * (1+r)  (Approx for monthly)
-    # We will do a month-by-month simulation for better charting
+    # Simple compound interest for regular contribution, invested at the start of each month:
+    # FV_m = P * ((1+r)^m - 1) / r * (1+r), evaluated for every scenario and month m at once
     
     results = {}
     months = duration_years * 12
     monthly_inv = amount # Assuming amount is per period, normalizing to monthly for chart simplicity
+    m = np.arange(1, months + 1, dtype=np.float64)
+    total_inv = monthly_inv * months
     
-    for name, rate in scenarios.items():
-        monthly_rate = rate / 12
-        values = []
-        invested = []
-        current_val = 0
-        total_inv = 0
-        
-        for m in range(1, months + 1):
-            total_inv += monthly_inv
-            current_val = (current_val + monthly_inv) * (1 + monthly_rate)
-            values.append(current_val)
-            invested.append(total_inv)
-            
+    # (3, 1) rates broadcast against (months,) -> (3, months) curves; r == 0 degenerates to P * m
+    rates = (annual_rates / 12)[:, None]
+    zero = rates == 0
+    safe_rates = np.where(zero, 1.0, rates)
+    # expm1(m*log1p(r)) == (1+r)^m - 1 without cancellation when r is tiny
+    values = monthly_inv * np.where(zero, m, np.expm1(m * np.log1p(rates)) / safe_rates * (1 + rates))
+    
+    for name, trend in zip(scenario_names, values):
+        final_value = float(trend[-1])
         results[name] = {
-            'final_value': current_val,
+            'final_value': final_value,
             'total_invested': total_inv,
-            'yield_rate': (current_val - total_inv) / total_inv,
-            'trend': values
+            'yield_rate': (final_value - total_inv) / total_inv,
+            'trend': trend.tolist()
         }
         
     return results
 
 def optimize_holdings(holdings_df):
     """
-    Analyze holdings and suggest optimizations based on REAL data.
+    Analyze holdings and suggest optimizations based on REAL data (short tips for dashboard).
+    Uses 'market_value' / 'profit_rate' when the frame has them; raw DB holdings fall back
+    to cost value for concentration and skip the loss check.
     """
     if holdings_df.empty:
         return []
@@ -734,41 +950,76 @@ def optimize_holdings(holdings_df):
     if num_funds > 10:
         suggestions.append(f"当前持仓基金数量为 {num_funds} 只，显著超过建议的 5-8 只。过度分散会导致收益平庸，建议精简并聚焦优质品种。")
     
-    # 2. Risk/Return Balance (Based on real performance if possible)
+    # 2. Deep loss check (profit rate)
+    if 'profit_rate' in holdings_df.columns:
+        deep_loss = holdings_df[holdings_df['profit_rate'] < -0.15]
+        if not deep_loss.empty:
+            names = deep_loss['fund_name'].tolist()
+            suggestions.append(f"亏损预警：{', '.join(names[:2])} 等 {len(names)} 只基金亏损超过15%，建议进行深度诊断决定去留。")
+    
+    # 3. Concentration check
+    if 'market_value' in holdings_df.columns:
+        mv = holdings_df['market_value'].to_numpy(dtype=np.float64)
+    else:
+        mv = holdings_df['share'].to_numpy(dtype=np.float64) * holdings_df['cost_price'].to_numpy(dtype=np.float64)
+    total = mv.sum()
+    if total > 0:
+        top = int(np.argmax(mv))
+        if mv[top] / total > 0.4:
+            top_name = holdings_df['fund_name'].iat[top]
+            suggestions.append(f"重仓提示：单一基金 {top_name} 占比超过40%，建议适当分散。")
+    
+    # 4. Risk/Return Balance (Based on real performance if possible)
     # Since we don't have all types in DB yet, we can't do full type analysis here
-    # but we can look at the profit/loss distribution
+    # but we can screen every holding's 1-year diagnosis in one batch
+    diagnoses = diagnose_funds_batch(holdings_df['fund_code'].tolist())
+    weak = [name for code, name in zip(holdings_df['fund_code'], holdings_df['fund_name'])
+            if 0 < diagnoses[code]['score'] < 2.5]
+    if weak:
+        suggestions.append(f"近一年评分偏低：{', '.join(weak[:2])} 等 {len(weak)} 只基金综合评分低于 2.5 分，收益与回撤表现较弱，建议进行深度诊断决定去留。")
     
-    # This is a placeholder for real logic that will be expanded as we add more data fields to DB
     suggestions.append("所有分析建议均基于您持仓的真实历史净值及实时估值计算得出。")
     
     return suggestions
 
+# [monotonic seconds, datetime] of the last now() taken; reused for up to a second
+_now_cache = [float('-inf'), None]
+
+def _now():
+    """
+    datetime.now(), refreshed at most once per second.
+    The trading-hours / effective-date checks run on every auto-refresh tick and only need
+    minute resolution, so they share one timestamp instead of each taking their own.
+    """
+    t = time.monotonic()
+    if t - _now_cache[0] >= 1.0:
+        _now_cache[1] = datetime.datetime.now()
+        _now_cache[0] = t
+    return _now_cache[1]
+
+# Minute-of-day lookup for the trading sessions (index = hour * 60 + minute)
+# Morning 9:15 to 11:35, afternoon 12:55 to 15:05, end minutes included
+_TRADING_MINUTES = bytearray(24 * 60)
+for _start, _end in ((9 * 60 + 15, 11 * 60 + 35), (12 * 60 + 55, 15 * 60 + 5)):
+    _TRADING_MINUTES[_start:_end + 1] = b'\x01' * (_end - _start + 1)
+
 def is_trading_time():
     """
     Check if the current time is within China's fund/stock trading hours.
     Mon-Fri: 9:15-11:35, 12:55-15:05 (includes pre-market and slight lag)
     """
-    now = datetime.datetime.now()
+    now = _now()
     
     # Check weekday (0-4 is Mon-Fri)
     if now.weekday() > 4:
         return False
-        
-    current_time = now.time()
-    
-    # Morning session (9:15 to 11:35)
-    morning_start = datetime.time(9, 15)
-    morning_end = datetime.time(11, 35)
-    
-    # Afternoon session (12:55 to 15:05)
-    afternoon_start = datetime.time(12, 55)
-    afternoon_end = datetime.time(15, 5)
     
-    if (morning_start <= current_time <= morning_end) or \
-       (afternoon_start <= current_time <= afternoon_end):
-        return True
-        
-    return False
+    return bool(_TRADING_MINUTES[now.hour * 60 + now.minute])
+
+# Mon..Sun -> days until the next weekday
+_NEXT_WEEKDAY_OFFSET = (1, 1, 1, 1, 3, 2, 1)
+# Minute of day from which today's NAV counts toward the next trading date (15:00)
+_CUTOFF_MINUTE = 15 * 60
 
 def get_effective_trading_date():
     """
@@ -778,25 +1029,23 @@ def get_effective_trading_date():
     - If Today is Weekday AND Time >= 15:00: Effective Date = Next Weekday
     - If Today is Weekend: Effective Date = Next Weekday
     """
-    now = datetime.datetime.now()
-    cutoff_time = datetime.time(15, 0)
+    now = _now()
+    weekday = now.weekday()
     
-    is_weekday = now.weekday() <= 4 # 0-4 is Mon-Fri
-    
-    if is_weekday and now.time() < cutoff_time:
+    # 0-4 is Mon-Fri
+    if weekday <= 4 and now.hour * 60 + now.minute < _CUTOFF_MINUTE:
         return now.strftime('%Y-%m-%d')
     else:
-        # Need to find next weekday
-        next_day = now + datetime.timedelta(days=1)
-        while next_day.weekday() > 4: # Skip Sat/Sun
-            next_day += datetime.timedelta(days=1)
+        # Next weekday: days to add, indexed by today's weekday (Fri/Sat/Sun -> Monday)
+        next_day = now + datetime.timedelta(days=_NEXT_WEEKDAY_OFFSET[weekday])
         return next_day.strftime('%Y-%m-%d')
 
-def calculate_new_cost(old_share, old_cost, trade_amount, trade_price, trade_type="buy"):
+def calculate_new_cost(old_share, old_cost, trade_amount, trade_price, trade_type="buy", is_buy=None):
     """
     Calculate new weighted average cost.
     
-    trade_type: "buy" (加仓) or "sell" (减仓)
+    is_buy: True (加仓) or False (减仓); when omitted, derived from trade_type
+    trade_type: "buy" (加仓) or "sell" (减仓), kept for existing callers
     trade_amount: 
       - If buy: Amount of Money (RMB) usually for Funds. 
         Wait, for ETF it's shares. For OTC Fund it's Money.
@@ -812,27 +1061,19 @@ def calculate_new_cost(old_share, old_cost, trade_amount, trade_price, trade_typ
     
     Returns: (new_share, new_cost)
     """
-    if trade_type == "sell":
+    if is_buy is None:
+        is_buy = trade_type != "sell"
+    
+    if not is_buy:
         # Sell: Cost price doesn't change (Weighted Average method)
-        # Share decreases
-        # Assuming trade_amount is Shares to sell
-        new_share = old_share - trade_amount
-        if new_share < 0: new_share = 0
-        return new_share, old_cost
-    
-    else: # Buy
-        # Buy: Weighted Average Cost updates
-        # Assuming trade_amount is Shares bought
-        # Cost = (Old_Value + New_Value) / Total_Shares
-        
-        old_value = old_share * old_cost
-        new_value = trade_amount * trade_price
-        
-        total_share = old_share + trade_amount
-        total_value = old_value + new_value
-        
-        if total_share == 0: return 0.0, 0.0
-        
-        new_cost = total_value / total_share
-        return total_share, new_cost
+        # Share decreases, assuming trade_amount is Shares to sell
+        return max(old_share - trade_amount, 0), old_cost
+    
+    # Buy: Weighted Average Cost updates
+    # Assuming trade_amount is Shares bought
+    # Cost = (Old_Value + New_Value) / Total_Shares
+    total_share = old_share + trade_amount
+    if total_share == 0: return 0.0, 0.0
+    
+    return total_share, (old_share * old_cost + trade_amount * trade_price) / total_share
 